@@ -48,6 +48,8 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter, range_boundaries
 from openpyxl.worksheet.worksheet import Worksheet
 
+import gf256
+
 # =======================
 # AES Core (FIPS-197 Standard)
 # =======================
@@ -76,18 +78,13 @@ RCON = [0x00,0x01,0x02,0x04,0x08,0x10,0x20,0x40,0x80,0x1B,0x36]
 
 def _xtime(a: int) -> int:
     """Multiply by x in GF(2^8)"""
-    a &= 0xFF
-    res = (a << 1) & 0xFF
-    if a & 0x80:
-        res ^= 0x1b
-    return res
+    return gf256.mul(a, 0x02)
 
 def _mul(a: int, b: int) -> int:
     """Multiply in GF(2^8) - only supports b=1,2,3"""
-    if b == 1: return a & 0xFF
-    if b == 2: return _xtime(a)
-    if b == 3: return _xtime(a) ^ (a & 0xFF)
-    raise ValueError("GF multiplier must be 1, 2, or 3")
+    if b not in (1, 2, 3):
+        raise ValueError("GF multiplier must be 1, 2, or 3")
+    return gf256.mul(a, b)
 
 def byte_to_binary(b: int) -> str:
     """Convert byte to 8-bit binary string"""
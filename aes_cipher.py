@@ -1,35 +1,219 @@
-import copy
+import operator
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+import gf256
+from metric_cache import sbox_fingerprint
+
+# Multiply-by-constant tables for (Inv)MixColumns, built once and shared by every code path
+_MUL2, _MUL3, _MUL9, _MUL11, _MUL13, _MUL14 = (gf256.mul_table(c) for c in (0x02, 0x03, 0x09, 0x0b, 0x0d, 0x0e))
+
+# Standard AES S-Box (used when no S-Box is given)
+AES_SBOX = (
+    0x63, 0x7c, 0x77, 0x7b, 0xf2, 0x6b, 0x6f, 0xc5, 0x30, 0x01, 0x67, 0x2b, 0xfe, 0xd7, 0xab, 0x76,
+    0xca, 0x82, 0xc9, 0x7d, 0xfa, 0x59, 0x47, 0xf0, 0xad, 0xd4, 0xa2, 0xaf, 0x9c, 0xa4, 0x72, 0xc0,
+    0xb7, 0xfd, 0x93, 0x26, 0x36, 0x3f, 0xf7, 0xcc, 0x34, 0xa5, 0xe5, 0xf1, 0x71, 0xd8, 0x31, 0x15,
+    0x04, 0xc7, 0x23, 0xc3, 0x18, 0x96, 0x05, 0x9a, 0x07, 0x12, 0x80, 0xe2, 0xeb, 0x27, 0xb2, 0x75,
+    0x09, 0x83, 0x2c, 0x1a, 0x1b, 0x6e, 0x5a, 0xa0, 0x52, 0x3b, 0xd6, 0xb3, 0x29, 0xe3, 0x2f, 0x84,
+    0x53, 0xd1, 0x00, 0xed, 0x20, 0xfc, 0xb1, 0x5b, 0x6a, 0xcb, 0xbe, 0x39, 0x4a, 0x4c, 0x58, 0xcf,
+    0xd0, 0xef, 0xaa, 0xfb, 0x43, 0x4d, 0x33, 0x85, 0x45, 0xf9, 0x02, 0x7f, 0x50, 0x3c, 0x9f, 0xa8,
+    0x51, 0xa3, 0x40, 0x8f, 0x92, 0x9d, 0x38, 0xf5, 0xbc, 0xb6, 0xda, 0x21, 0x10, 0xff, 0xf3, 0xd2,
+    0xcd, 0x0c, 0x13, 0xec, 0x5f, 0x97, 0x44, 0x17, 0xc4, 0xa7, 0x7e, 0x3d, 0x64, 0x5d, 0x19, 0x73,
+    0x60, 0x81, 0x4f, 0xdc, 0x22, 0x2a, 0x90, 0x88, 0x46, 0xee, 0xb8, 0x14, 0xde, 0x5e, 0x0b, 0xdb,
+    0xe0, 0x32, 0x3a, 0x0a, 0x49, 0x06, 0x24, 0x5c, 0xc2, 0xd3, 0xac, 0x62, 0x91, 0x95, 0xe4, 0x79,
+    0xe7, 0xc8, 0x37, 0x6d, 0x8d, 0xd5, 0x4e, 0xa9, 0x6c, 0x56, 0xf4, 0xea, 0x65, 0x7a, 0xae, 0x08,
+    0xba, 0x78, 0x25, 0x2e, 0x1c, 0xa6, 0xb4, 0xc6, 0xe8, 0xdd, 0x74, 0x1f, 0x4b, 0xbd, 0x8b, 0x8a,
+    0x70, 0x3e, 0xb5, 0x66, 0x48, 0x03, 0xf6, 0x0e, 0x61, 0x35, 0x57, 0xb9, 0x86, 0xc1, 0x1d, 0x9e,
+    0xe1, 0xf8, 0x98, 0x11, 0x69, 0xd9, 0x8e, 0x94, 0x9b, 0x1e, 0x87, 0xe9, 0xce, 0x55, 0x28, 0xdf,
+    0x8c, 0xa1, 0x89, 0x0d, 0xbf, 0xe6, 0x42, 0x68, 0x41, 0x99, 0x2d, 0x0f, 0xb0, 0x54, 0xbb, 0x16
+)
+
+@lru_cache(maxsize=32)
+def _build_t_tables(sbox):
+    """
+    Builds the 32-bit round tables for an S-Box (passed as a tuple).
+    Te0..Te3 fold SubBytes + MixColumns, Td0..Td3 fold InvSubBytes + InvMixColumns.
+    Each table is a byte rotation of the previous one.
+    """
+    inv_sbox = [0] * 256
+    for i, val in enumerate(sbox):
+        inv_sbox[val] = i
+
+    Te0, Te1, Te2, Te3 = [0] * 256, [0] * 256, [0] * 256, [0] * 256
+    Td0, Td1, Td2, Td3 = [0] * 256, [0] * 256, [0] * 256, [0] * 256
+    for x in range(256):
+        s = sbox[x]
+        s2, s3 = _MUL2[s], _MUL3[s]
+        Te0[x] = (s2 << 24) | (s << 16) | (s << 8) | s3
+        Te1[x] = (s3 << 24) | (s2 << 16) | (s << 8) | s
+        Te2[x] = (s << 24) | (s3 << 16) | (s2 << 8) | s
+        Te3[x] = (s << 24) | (s << 16) | (s3 << 8) | s2
+
+        si = inv_sbox[x]
+        se, s9 = _MUL14[si], _MUL9[si]
+        sd, sb = _MUL13[si], _MUL11[si]
+        Td0[x] = (se << 24) | (s9 << 16) | (sd << 8) | sb
+        Td1[x] = (sb << 24) | (se << 16) | (s9 << 8) | sd
+        Td2[x] = (sd << 24) | (sb << 16) | (se << 8) | s9
+        Td3[x] = (s9 << 24) | (sd << 16) | (sb << 8) | se
+
+    return (Te0, Te1, Te2, Te3), (Td0, Td1, Td2, Td3), inv_sbox
+
+
+def _inv_mix_word(word):
+    """InvMixColumns applied to a single 32-bit column word."""
+    a0, a1, a2, a3 = (word >> 24) & 0xFF, (word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF
+    b0 = _MUL14[a0] ^ _MUL11[a1] ^ _MUL13[a2] ^ _MUL9[a3]
+    b1 = _MUL9[a0] ^ _MUL14[a1] ^ _MUL11[a2] ^ _MUL13[a3]
+    b2 = _MUL13[a0] ^ _MUL9[a1] ^ _MUL14[a2] ^ _MUL11[a3]
+    b3 = _MUL11[a0] ^ _MUL13[a1] ^ _MUL9[a2] ^ _MUL14[a3]
+    return (b0 << 24) | (b1 << 16) | (b2 << 8) | b3
+
+
+# --- Batch (NumPy) Engine Tables ---
+# Byte index i = row + 4*col (column-major, same as the input block layout)
+_SHIFT_ROWS = np.array([(i % 4) + 4 * ((i // 4 + i % 4) % 4) for i in range(16)])
+_INV_SHIFT_ROWS = np.array([(i % 4) + 4 * ((i // 4 - i % 4) % 4) for i in range(16)])
+_XTIME = np.array(_MUL2, dtype=np.uint8)
+
+# Every 16-bit value viewed as its two bytes; lets byte tables be applied two bytes per lookup
+_BYTE_PAIRS = np.arange(65536, dtype=np.uint16).view(np.uint8)
+
+
+def _pair_table(table):
+    """Expands a 256-entry byte table to a 65536-entry table over byte pairs (uint16)."""
+    return np.asarray(table, dtype=np.uint8)[_BYTE_PAIRS].view(np.uint16)
+
+
+_XTIME16 = _pair_table(_XTIME)
+_X4_16 = _pair_table(gf256.mul_table(0x04))  # xtime applied twice, in one lookup
+
+
+def _lookup(table16, state):
+    """Applies a byte table (in pair form) to every byte of a contiguous uint8 array."""
+    return table16[np.ascontiguousarray(state).view(np.uint16)].view(np.uint8)
+
+
+def _mix_columns_batch(state):
+    """
+    MixColumns on an (N, 16) state array.
+    Each column is one little-endian 32-bit word (byte r at bits 8r), so rotating
+    the rows of a column is a word rotation.
+    """
+    w = state.view('<u4')
+    x = w ^ ((w >> 8) | (w << 24))   # a[r] ^ a[r+1]
+    t = x ^ ((x >> 16) | (x << 16))  # a0 ^ a1 ^ a2 ^ a3
+    return (w ^ t ^ _lookup(_XTIME16, x.view(np.uint8)).view('<u4')).view(np.uint8)
+
+
+def _inv_mix_columns_batch(state):
+    """InvMixColumns on an (N, 16) state array (xtime^2 pre-step followed by MixColumns)."""
+    w = state.view('<u4')
+    y = w ^ ((w >> 16) | (w << 16))  # a[r] ^ a[r+2]
+    u = _lookup(_X4_16, y.view(np.uint8))
+    return _mix_columns_batch(state ^ u)
+
+
+# Blocks of CTR keystream generated per batch (1 MiB)
+CTR_CHUNK_BLOCKS = 65536
+
+
+# --- Traced Single-Block Engine ---
+# The traced path keeps the state as 16 bytes (block layout) so every step is one
+# bytes object: SubBytes is bytes.translate, ShiftRows an itemgetter permutation.
+_SHIFT_ROWS_BYTES = operator.itemgetter(*_SHIFT_ROWS.tolist())
+
+
+def _mix_columns_bytes(state):
+    """MixColumns on a 16-byte state (column c is state[4c:4c+4])."""
+    out = bytearray(16)
+    for c in range(0, 16, 4):
+        s0, s1, s2, s3 = state[c], state[c + 1], state[c + 2], state[c + 3]
+        out[c] = _MUL2[s0] ^ _MUL3[s1] ^ s2 ^ s3
+        out[c + 1] = s0 ^ _MUL2[s1] ^ _MUL3[s2] ^ s3
+        out[c + 2] = s0 ^ s1 ^ _MUL2[s2] ^ _MUL3[s3]
+        out[c + 3] = _MUL3[s0] ^ s1 ^ s2 ^ _MUL2[s3]
+    return bytes(out)
+
+
+class TraceRecorder:
+    """
+    Step-by-step record of one block encryption.
+
+    Each step is a 16-byte state snapshot written into one preallocated buffer;
+    round keys are recorded by round index, not copied. The nested-dict format
+    of `encrypt_block(trace=True)` is only built by `to_dicts()`, and
+    `states` / `to_compact()` give the compact forms.
+    """
+
+    def __init__(self, round_key_bytes, Nr):
+        self.round_key_bytes = round_key_bytes
+        self.size = 4 * Nr + 1  # Input + AddRoundKey + 4 steps per round - final MixColumns
+        self.buffer = bytearray(16 * self.size)
+        self.rounds = [None] * self.size
+        self.steps = [None] * self.size
+        self.key_rounds = [None] * self.size
+        self.count = 0
+
+    def record(self, round_num, step, state, key_round=None):
+        i = self.count
+        self.buffer[16 * i:16 * (i + 1)] = state
+        self.rounds[i] = round_num
+        self.steps[i] = step
+        self.key_rounds[i] = key_round
+        self.count = i + 1
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def states(self):
+        """(steps, 16) uint8 view of the snapshots, bytes in block layout."""
+        return np.frombuffer(self.buffer, dtype=np.uint8)[:16 * self.count].reshape(-1, 16)
+
+    def to_dicts(self):
+        """The classic trace: list of {'round', 'step', 'state': 4x4, 'key': 4x4 or None}."""
+        trace_data = []
+        for i in range(self.count):
+            snap = self.buffer[16 * i:16 * (i + 1)]
+            key_round = self.key_rounds[i]
+            key = None
+            if key_round is not None:
+                rk = self.round_key_bytes[key_round]
+                key = [list(rk[r::4]) for r in range(4)]
+            trace_data.append({
+                'round': self.rounds[i],
+                'step': self.steps[i],
+                'state': [list(snap[r::4]) for r in range(4)],
+                'key': key
+            })
+        return trace_data
+
+    def to_compact(self):
+        """JSON-friendly compact form: one hex string per state, keys as round indices."""
+        return {
+            'rounds': self.rounds[:self.count],
+            'steps': self.steps[:self.count],
+            'states': [self.buffer[16 * i:16 * (i + 1)].hex() for i in range(self.count)],
+            'key_rounds': self.key_rounds[:self.count],
+            'round_keys': [rk.hex() for rk in self.round_key_bytes]
+        }
+
 
 class AESCipher:
     def __init__(self, key, sbox=None):
         self.key = key
         # Default AES S-Box if none provided
         if sbox is None:
-            self.sbox = [
-                0x63, 0x7c, 0x77, 0x7b, 0xf2, 0x6b, 0x6f, 0xc5, 0x30, 0x01, 0x67, 0x2b, 0xfe, 0xd7, 0xab, 0x76,
-                0xca, 0x82, 0xc9, 0x7d, 0xfa, 0x59, 0x47, 0xf0, 0xad, 0xd4, 0xa2, 0xaf, 0x9c, 0xa4, 0x72, 0xc0,
-                0xb7, 0xfd, 0x93, 0x26, 0x36, 0x3f, 0xf7, 0xcc, 0x34, 0xa5, 0xe5, 0xf1, 0x71, 0xd8, 0x31, 0x15,
-                0x04, 0xc7, 0x23, 0xc3, 0x18, 0x96, 0x05, 0x9a, 0x07, 0x12, 0x80, 0xe2, 0xeb, 0x27, 0xb2, 0x75,
-                0x09, 0x83, 0x2c, 0x1a, 0x1b, 0x6e, 0x5a, 0xa0, 0x52, 0x3b, 0xd6, 0xb3, 0x29, 0xe3, 0x2f, 0x84,
-                0x53, 0xd1, 0x00, 0xed, 0x20, 0xfc, 0xb1, 0x5b, 0x6a, 0xcb, 0xbe, 0x39, 0x4a, 0x4c, 0x58, 0xcf,
-                0xd0, 0xef, 0xaa, 0xfb, 0x43, 0x4d, 0x33, 0x85, 0x45, 0xf9, 0x02, 0x7f, 0x50, 0x3c, 0x9f, 0xa8,
-                0x51, 0xa3, 0x40, 0x8f, 0x92, 0x9d, 0x38, 0xf5, 0xbc, 0xb6, 0xda, 0x21, 0x10, 0xff, 0xf3, 0xd2,
-                0xcd, 0x0c, 0x13, 0xec, 0x5f, 0x97, 0x44, 0x17, 0xc4, 0xa7, 0x7e, 0x3d, 0x64, 0x5d, 0x19, 0x73,
-                0x60, 0x81, 0x4f, 0xdc, 0x22, 0x2a, 0x90, 0x88, 0x46, 0xee, 0xb8, 0x14, 0xde, 0x5e, 0x0b, 0xdb,
-                0xe0, 0x32, 0x3a, 0x0a, 0x49, 0x06, 0x24, 0x5c, 0xc2, 0xd3, 0xac, 0x62, 0x91, 0x95, 0xe4, 0x79,
-                0xe7, 0xc8, 0x37, 0x6d, 0x8d, 0xd5, 0x4e, 0xa9, 0x6c, 0x56, 0xf4, 0xea, 0x65, 0x7a, 0xae, 0x08,
-                0xba, 0x78, 0x25, 0x2e, 0x1c, 0xa6, 0xb4, 0xc6, 0xe8, 0xdd, 0x74, 0x1f, 0x4b, 0xbd, 0x8b, 0x8a,
-                0x70, 0x3e, 0xb5, 0x66, 0x48, 0x03, 0xf6, 0x0e, 0x61, 0x35, 0x57, 0xb9, 0x86, 0xc1, 0x1d, 0x9e,
-                0xe1, 0xf8, 0x98, 0x11, 0x69, 0xd9, 0x8e, 0x94, 0x9b, 0x1e, 0x87, 0xe9, 0xce, 0x55, 0x28, 0xdf,
-                0x8c, 0xa1, 0x89, 0x0d, 0xbf, 0xe6, 0x42, 0x68, 0x41, 0x99, 0x2d, 0x0f, 0xb0, 0x54, 0xbb, 0x16
-            ]
+            self.sbox = list(AES_SBOX)
         else:
-            self.sbox = sbox
+            self.sbox = [int(x) for x in sbox]
 
-        # Calculate Inverse S-Box
-        self.inv_sbox = [0] * 256
-        for i, val in enumerate(self.sbox):
-            self.inv_sbox[val] = i
+        # T-Tables (shared between instances using the same S-Box) + Inverse S-Box
+        self.Te, self.Td, self.inv_sbox = _build_t_tables(tuple(self.sbox))
 
         # Rcon (Round Constants)
         self.Rcon = [
@@ -41,6 +225,22 @@ class AESCipher:
         self.Nr = self.Nk + 6  # Number of rounds
 
         self.w = self.key_expansion()
+        self.dw = self.inv_key_expansion()
+
+        # Batch engine: S-Boxes as byte-pair tables, round keys as (Nr+1, 16) bytes in block layout
+        self.sbox16 = _pair_table(self.sbox)
+        self.inv_sbox16 = _pair_table(self.inv_sbox)
+        self.round_keys = np.frombuffer(
+            b''.join(word.to_bytes(4, 'big') for word in self.w), dtype=np.uint8
+        ).reshape(self.Nr + 1, 16)
+        self.dec_round_keys = np.frombuffer(
+            b''.join(word.to_bytes(4, 'big') for word in self.dw), dtype=np.uint8
+        ).reshape(self.Nr + 1, 16)
+
+        # Round keys pre-split into bytes (block layout: byte r + 4*c is row r, column c)
+        self.round_key_bytes = [bytes(rk) for rk in self.round_keys]
+        self.round_key_ints = [int.from_bytes(rk, 'big') for rk in self.round_key_bytes]
+        self.sbox_bytes = bytes(self.sbox)
 
     def sub_word(self, word):
         return (self.sbox[(word >> 24) & 0xFF] << 24) | \
@@ -66,23 +266,30 @@ class AESCipher:
             w[i] = w[i-self.Nk] ^ temp
         return w
 
+    def inv_key_expansion(self):
+        """
+        Decryption round keys for the equivalent inverse cipher (FIPS-197 5.3.5):
+        round keys in reverse order, InvMixColumns applied to rounds 1..Nr-1, so
+        decryption has the same round shape as encryption (Td-tables / batch).
+        """
+        dw = []
+        for round_num in range(self.Nr, -1, -1):
+            words = self.w[round_num * self.Nb:(round_num + 1) * self.Nb]
+            if 0 < round_num < self.Nr:
+                words = [_inv_mix_word(word) for word in words]
+            dw.extend(words)
+        return dw
+
     def get_round_key(self, round_num):
-        key_schedule = [[0] * self.Nb for _ in range(4)]
-        for c in range(self.Nb):
-            word = self.w[round_num * self.Nb + c]
-            key_schedule[0][c] = (word >> 24) & 0xFF
-            key_schedule[1][c] = (word >> 16) & 0xFF
-            key_schedule[2][c] = (word >> 8) & 0xFF
-            key_schedule[3][c] = word & 0xFF
-        return key_schedule
+        rk = self.round_key_bytes[round_num]
+        return [list(rk[r::4]) for r in range(4)]
 
     def add_round_key(self, state, round_num):
-        for c in range(self.Nb):
-            word = self.w[round_num * self.Nb + c]
-            state[0][c] ^= (word >> 24) & 0xFF
-            state[1][c] ^= (word >> 16) & 0xFF
-            state[2][c] ^= (word >> 8) & 0xFF
-            state[3][c] ^= word & 0xFF
+        rk = self.round_key_bytes[round_num]
+        for r in range(4):
+            row = state[r]
+            for c in range(self.Nb):
+                row[c] ^= rk[r + 4*c]
         return state
 
     def sub_bytes(self, state):
@@ -104,16 +311,7 @@ class AESCipher:
         return state
 
     def gmul(self, a, b):
-        p = 0
-        for _ in range(8):
-            if b & 1:
-                p ^= a
-            hi_bit_set = a & 0x80
-            a = (a << 1) & 0xFF
-            if hi_bit_set:
-                a ^= 0x1b
-            b >>= 1
-        return p
+        return gf256.mul(a, b)
 
     def mix_columns(self, state):
         for c in range(self.Nb):
@@ -122,77 +320,298 @@ class AESCipher:
             s2 = state[2][c]
             s3 = state[3][c]
 
-            state[0][c] = self.gmul(0x02, s0) ^ self.gmul(0x03, s1) ^ s2 ^ s3
-            state[1][c] = s0 ^ self.gmul(0x02, s1) ^ self.gmul(0x03, s2) ^ s3
-            state[2][c] = s0 ^ s1 ^ self.gmul(0x02, s2) ^ self.gmul(0x03, s3)
-            state[3][c] = self.gmul(0x03, s0) ^ s1 ^ s2 ^ self.gmul(0x02, s3)
+            state[0][c] = _MUL2[s0] ^ _MUL3[s1] ^ s2 ^ s3
+            state[1][c] = s0 ^ _MUL2[s1] ^ _MUL3[s2] ^ s3
+            state[2][c] = s0 ^ s1 ^ _MUL2[s2] ^ _MUL3[s3]
+            state[3][c] = _MUL3[s0] ^ s1 ^ s2 ^ _MUL2[s3]
         return state
 
+    def encrypt_block_fast(self, input_block):
+        """Encrypts one 16-byte block using the T-Tables (32-bit word lookups + XOR)."""
+        return list(self.encrypt_block_int(int.from_bytes(bytes(input_block), 'big')).to_bytes(16, 'big'))
+
+    def encrypt_block_int(self, block):
+        """
+        Compact path: the block is one 128-bit integer (int.from_bytes(block, 'big'))
+        and the state lives in four 32-bit words, so no per-block lists are allocated.
+        """
+        Te0, Te1, Te2, Te3 = self.Te
+        sbox = self.sbox
+        w = self.w
+
+        s0 = (block >> 96) ^ w[0]
+        s1 = ((block >> 64) & 0xFFFFFFFF) ^ w[1]
+        s2 = ((block >> 32) & 0xFFFFFFFF) ^ w[2]
+        s3 = (block & 0xFFFFFFFF) ^ w[3]
+
+        k = 4
+        for _ in range(1, self.Nr):
+            t0 = Te0[s0 >> 24] ^ Te1[(s1 >> 16) & 0xFF] ^ Te2[(s2 >> 8) & 0xFF] ^ Te3[s3 & 0xFF] ^ w[k]
+            t1 = Te0[s1 >> 24] ^ Te1[(s2 >> 16) & 0xFF] ^ Te2[(s3 >> 8) & 0xFF] ^ Te3[s0 & 0xFF] ^ w[k + 1]
+            t2 = Te0[s2 >> 24] ^ Te1[(s3 >> 16) & 0xFF] ^ Te2[(s0 >> 8) & 0xFF] ^ Te3[s1 & 0xFF] ^ w[k + 2]
+            t3 = Te0[s3 >> 24] ^ Te1[(s0 >> 16) & 0xFF] ^ Te2[(s1 >> 8) & 0xFF] ^ Te3[s2 & 0xFF] ^ w[k + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+            k += 4
+
+        # Final Round (no MixColumns)
+        t0 = ((sbox[s0 >> 24] << 24) | (sbox[(s1 >> 16) & 0xFF] << 16) |
+              (sbox[(s2 >> 8) & 0xFF] << 8) | sbox[s3 & 0xFF]) ^ w[k]
+        t1 = ((sbox[s1 >> 24] << 24) | (sbox[(s2 >> 16) & 0xFF] << 16) |
+              (sbox[(s3 >> 8) & 0xFF] << 8) | sbox[s0 & 0xFF]) ^ w[k + 1]
+        t2 = ((sbox[s2 >> 24] << 24) | (sbox[(s3 >> 16) & 0xFF] << 16) |
+              (sbox[(s0 >> 8) & 0xFF] << 8) | sbox[s1 & 0xFF]) ^ w[k + 2]
+        t3 = ((sbox[s3 >> 24] << 24) | (sbox[(s0 >> 16) & 0xFF] << 16) |
+              (sbox[(s1 >> 8) & 0xFF] << 8) | sbox[s2 & 0xFF]) ^ w[k + 3]
+
+        return (t0 << 96) | (t1 << 64) | (t2 << 32) | t3
+
+    def decrypt_block_fast(self, input_block):
+        """Decrypts one 16-byte block using the inverse T-Tables and the decryption round keys."""
+        return list(self.decrypt_block_int(int.from_bytes(bytes(input_block), 'big')).to_bytes(16, 'big'))
+
+    def decrypt_block_int(self, block):
+        """Compact-path inverse of `encrypt_block_int` (128-bit integer in and out)."""
+        Td0, Td1, Td2, Td3 = self.Td
+        inv_sbox = self.inv_sbox
+        dw = self.dw
+
+        s0 = (block >> 96) ^ dw[0]
+        s1 = ((block >> 64) & 0xFFFFFFFF) ^ dw[1]
+        s2 = ((block >> 32) & 0xFFFFFFFF) ^ dw[2]
+        s3 = (block & 0xFFFFFFFF) ^ dw[3]
+
+        k = 4
+        for _ in range(1, self.Nr):
+            t0 = Td0[s0 >> 24] ^ Td1[(s3 >> 16) & 0xFF] ^ Td2[(s2 >> 8) & 0xFF] ^ Td3[s1 & 0xFF] ^ dw[k]
+            t1 = Td0[s1 >> 24] ^ Td1[(s0 >> 16) & 0xFF] ^ Td2[(s3 >> 8) & 0xFF] ^ Td3[s2 & 0xFF] ^ dw[k + 1]
+            t2 = Td0[s2 >> 24] ^ Td1[(s1 >> 16) & 0xFF] ^ Td2[(s0 >> 8) & 0xFF] ^ Td3[s3 & 0xFF] ^ dw[k + 2]
+            t3 = Td0[s3 >> 24] ^ Td1[(s2 >> 16) & 0xFF] ^ Td2[(s1 >> 8) & 0xFF] ^ Td3[s0 & 0xFF] ^ dw[k + 3]
+            s0, s1, s2, s3 = t0, t1, t2, t3
+            k += 4
+
+        # Final Round (no InvMixColumns)
+        t0 = ((inv_sbox[s0 >> 24] << 24) | (inv_sbox[(s3 >> 16) & 0xFF] << 16) |
+              (inv_sbox[(s2 >> 8) & 0xFF] << 8) | inv_sbox[s1 & 0xFF]) ^ dw[k]
+        t1 = ((inv_sbox[s1 >> 24] << 24) | (inv_sbox[(s0 >> 16) & 0xFF] << 16) |
+              (inv_sbox[(s3 >> 8) & 0xFF] << 8) | inv_sbox[s2 & 0xFF]) ^ dw[k + 1]
+        t2 = ((inv_sbox[s2 >> 24] << 24) | (inv_sbox[(s1 >> 16) & 0xFF] << 16) |
+              (inv_sbox[(s0 >> 8) & 0xFF] << 8) | inv_sbox[s3 & 0xFF]) ^ dw[k + 2]
+        t3 = ((inv_sbox[s3 >> 24] << 24) | (inv_sbox[(s2 >> 16) & 0xFF] << 16) |
+              (inv_sbox[(s1 >> 8) & 0xFF] << 8) | inv_sbox[s0 & 0xFF]) ^ dw[k + 3]
+
+        return (t0 << 96) | (t1 << 64) | (t2 << 32) | t3
+
     def encrypt_block(self, input_block, trace=False):
-        trace_data = []
-        
-        state = [[0] * self.Nb for _ in range(4)]
-        for r in range(4):
-            for c in range(self.Nb):
-                state[r][c] = input_block[r + 4*c]
+        if not trace:
+            return self.encrypt_block_fast(input_block)
 
-        if trace:
-            trace_data.append({'round': 'Init', 'step': 'Input', 'state': copy.deepcopy(state), 'key': None})
+        output, recorder = self.encrypt_block_traced(input_block)
+        return output, recorder.to_dicts()
 
-        state = self.add_round_key(state, 0)
-        
-        if trace:
-            # Get Round Key 0
-            rk = self.get_round_key(0)
-            trace_data.append({'round': 0, 'step': 'AddRoundKey', 'state': copy.deepcopy(state), 'key': rk})
+    def encrypt_block_traced(self, input_block):
+        """
+        Encrypts one block step by step, recording every intermediate state.
+        Returns (output, TraceRecorder).
+        """
+        recorder = TraceRecorder(self.round_key_bytes, self.Nr)
+        rk = self.round_key_ints
+        sbox_bytes = self.sbox_bytes
+
+        state = bytes(input_block)
+        recorder.record('Init', 'Input', state)
+
+        state = (int.from_bytes(state, 'big') ^ rk[0]).to_bytes(16, 'big')
+        recorder.record(0, 'AddRoundKey', state, 0)
 
         for round_num in range(1, self.Nr):
-            state = self.sub_bytes(state)
-            if trace: trace_data.append({'round': round_num, 'step': 'SubBytes', 'state': copy.deepcopy(state), 'key': None})
-            
-            state = self.shift_rows(state)
-            if trace: trace_data.append({'round': round_num, 'step': 'ShiftRows', 'state': copy.deepcopy(state), 'key': None})
-            
-            state = self.mix_columns(state)
-            if trace: trace_data.append({'round': round_num, 'step': 'MixColumns', 'state': copy.deepcopy(state), 'key': None})
-            
-            state = self.add_round_key(state, round_num)
-            if trace: 
-                rk = self.get_round_key(round_num)
-                trace_data.append({'round': round_num, 'step': 'AddRoundKey', 'state': copy.deepcopy(state), 'key': rk})
+            state = state.translate(sbox_bytes)
+            recorder.record(round_num, 'SubBytes', state)
 
-        state = self.sub_bytes(state)
-        if trace: trace_data.append({'round': self.Nr, 'step': 'SubBytes', 'state': copy.deepcopy(state), 'key': None})
-        
-        state = self.shift_rows(state)
-        if trace: trace_data.append({'round': self.Nr, 'step': 'ShiftRows', 'state': copy.deepcopy(state), 'key': None})
-        
-        state = self.add_round_key(state, self.Nr)
-        if trace: 
-            rk = self.get_round_key(self.Nr)
-            trace_data.append({'round': self.Nr, 'step': 'AddRoundKey', 'state': copy.deepcopy(state), 'key': rk})
+            state = bytes(_SHIFT_ROWS_BYTES(state))
+            recorder.record(round_num, 'ShiftRows', state)
 
-        output = [0] * 16
-        for r in range(4):
-            for c in range(self.Nb):
-                output[r + 4*c] = state[r][c]
-        
-        if trace:
-            return output, trace_data
-        return output
+            state = _mix_columns_bytes(state)
+            recorder.record(round_num, 'MixColumns', state)
 
-    def encrypt_data(self, data):
-        # Padding (PKCS7)
-        pad_len = 16 - (len(data) % 16)
-        data += bytes([pad_len] * pad_len)
+            state = (int.from_bytes(state, 'big') ^ rk[round_num]).to_bytes(16, 'big')
+            recorder.record(round_num, 'AddRoundKey', state, round_num)
 
-        encrypted_data = bytearray()
+        state = state.translate(sbox_bytes)
+        recorder.record(self.Nr, 'SubBytes', state)
+
+        state = bytes(_SHIFT_ROWS_BYTES(state))
+        recorder.record(self.Nr, 'ShiftRows', state)
+
+        state = (int.from_bytes(state, 'big') ^ rk[self.Nr]).to_bytes(16, 'big')
+        recorder.record(self.Nr, 'AddRoundKey', state, self.Nr)
+
+        return list(state), recorder
+
+    def encrypt_blocks(self, blocks):
+        """
+        Encrypts N blocks at once (ECB). `blocks` is an (N, 16) uint8 array
+        (or anything reshapeable to it); every round is applied to all N blocks.
+        Returns an (N, 16) uint8 array.
+        """
+        rk = self.round_keys
+        state = np.asarray(blocks, dtype=np.uint8).reshape(-1, 16) ^ rk[0]
+
+        for round_num in range(1, self.Nr):
+            state = _lookup(self.sbox16, np.take(state, _SHIFT_ROWS, axis=1))  # ShiftRows + SubBytes
+            state = _mix_columns_batch(state)
+            state ^= rk[round_num]
+
+        state = _lookup(self.sbox16, np.take(state, _SHIFT_ROWS, axis=1))
+        state ^= rk[self.Nr]
+        return state
+
+    def decrypt_blocks(self, blocks):
+        """
+        Decrypts N blocks at once (ECB). Inverse of `encrypt_blocks`.
+        Equivalent inverse cipher: with the pre-transformed round keys the rounds
+        have the same shape as encryption (substitute + shift, mix, add key).
+        """
+        drk = self.dec_round_keys
+        state = np.asarray(blocks, dtype=np.uint8).reshape(-1, 16) ^ drk[0]
+
+        for round_num in range(1, self.Nr):
+            state = _lookup(self.inv_sbox16, np.take(state, _INV_SHIFT_ROWS, axis=1))  # InvShiftRows + InvSubBytes
+            state = _inv_mix_columns_batch(state)
+            state ^= drk[round_num]
+
+        state = _lookup(self.inv_sbox16, np.take(state, _INV_SHIFT_ROWS, axis=1))
+        state ^= drk[self.Nr]
+        return state
+
+    def encryptor(self, mode='ecb', iv=None):
+        """Incremental encryption context (update/update_into/finalize), see StreamContext."""
+        return StreamContext(self, mode, decrypt=False, iv=iv)
+
+    def decryptor(self, mode='ecb', iv=None):
+        """Incremental decryption context (update/update_into/finalize), see StreamContext."""
+        return StreamContext(self, mode, decrypt=True, iv=iv)
+
+    def encrypt_data(self, data):
+        # Whole blocks are read in place and written straight into the output;
+        # only the final block is padded (PKCS7). Returns the bytearray itself,
+        # so the ciphertext is never copied.
+        out = bytearray(len(data) - len(data) % 16 + 16)
+        context = self.encryptor()
+        written = context.update_into(data, out)
+        tail = context.finalize()
+        out[written:written + len(tail)] = tail
+        return out
+
+    def encrypt_cbc(self, data, iv):
+        """
+        CBC encryption of block-aligned `data` (no padding added). Chaining makes
+        this inherently serial, so it runs on the compact 128-bit integer path.
+        """
+        if len(data) % 16 != 0:
+            raise ValueError('CBC input length must be a multiple of 16 bytes.')
+
+        view = memoryview(data)
+        out = bytearray(len(data))
+        prev = int.from_bytes(bytes(iv), 'big')
         for i in range(0, len(data), 16):
-            block = list(data[i:i+16])
-            encrypted_block = self.encrypt_block(block)
-            encrypted_data.extend(encrypted_block)
-        
-        return bytes(encrypted_data)
+            prev = self.encrypt_block_int(int.from_bytes(view[i:i + 16], 'big') ^ prev)
+            out[i:i + 16] = prev.to_bytes(16, 'big')
+        return bytes(out)
+
+    def decrypt_cbc(self, data, iv):
+        """
+        CBC decryption of block-aligned `data` (padding is left in place).
+        Every block is decrypted independently in one batch, then the chaining
+        XOR with the previous ciphertext block (IV for the first) is one vector op.
+        """
+        if len(data) % 16 != 0:
+            raise ValueError('Ciphertext length must be a multiple of 16 bytes.')
+
+        blocks = np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+        plain = self.decrypt_blocks(blocks)
+        if len(blocks):
+            plain[0] ^= np.frombuffer(bytes(iv), dtype=np.uint8)
+            plain[1:] ^= blocks[:-1]
+        return plain.tobytes()
+
+    def ctr_keystream(self, iv, start_block, num_blocks):
+        """
+        CTR keystream for blocks start_block .. start_block + num_blocks - 1.
+        Counter block i is (iv + i) mod 2^128, big-endian. Every range is
+        independent of the others, so a buffer can be split across workers.
+        Returns a (num_blocks, 16) uint8 array.
+        """
+        first = (int.from_bytes(bytes(iv), 'big') + start_block) % (1 << 128)
+        high, low = np.uint64(first >> 64), np.uint64(first & 0xFFFFFFFFFFFFFFFF)
+
+        # 128-bit increment as two 64-bit halves (uint64 arrays wrap on overflow)
+        counters = np.empty((num_blocks, 2), dtype='>u8')
+        counters[:, 1] = low + np.arange(num_blocks, dtype=np.uint64)
+        counters[:, 0] = high + (counters[:, 1] < low)
+        return self.encrypt_blocks(counters.view(np.uint8))
+
+    def encrypt_ctr(self, data, iv, offset=0):
+        """
+        CTR mode: XORs `data` with the keystream starting at byte `offset` of the
+        stream, so any byte range can be processed on its own (random access).
+        No padding; the output has the same length as `data`.
+        """
+        data = np.frombuffer(data, dtype=np.uint8)
+        end = offset + len(data)
+        out = np.empty_like(data)
+
+        # Keystream in chunks of CTR_CHUNK_BLOCKS to bound temporary memory
+        for block in range(offset // 16, (end + 15) // 16, CTR_CHUNK_BLOCKS):
+            num_blocks = min(CTR_CHUNK_BLOCKS, (end + 15) // 16 - block)
+            keystream = self.ctr_keystream(iv, block, num_blocks).reshape(-1)
+            lo = max(block * 16, offset)
+            hi = min((block + num_blocks) * 16, end)
+            out[lo - offset:hi - offset] = data[lo - offset:hi - offset] ^ keystream[lo - block * 16:hi - block * 16]
+        return out.tobytes()
+
+    def decrypt_ctr(self, data, iv, offset=0):
+        """CTR decryption is the same keystream XOR as encryption."""
+        return self.encrypt_ctr(data, iv, offset)
+
+    def reencrypt(self, ciphertext, old_data, new_data, mode='ecb', iv=None):
+        """
+        Ciphertext of `new_data`, given `ciphertext` = encryption of `old_data`
+        (same length, key, mode and IV) as returned by encrypt_data (ECB),
+        encrypt_cbc of the PKCS7-padded data (CBC) or encrypt_ctr (CTR).
+        Only what the change reaches is recomputed: the changed blocks (ECB),
+        the blocks from the first change on (CBC), a plain XOR of the difference (CTR).
+        """
+        if len(old_data) != len(new_data):
+            raise ValueError('Old and new data must have the same length.')
+        if mode != 'ecb' and (iv is None or len(iv) != 16):
+            raise ValueError(f'{mode.upper()} mode needs a 16-byte IV.')
+
+        old = np.frombuffer(old_data, dtype=np.uint8)
+        new = np.frombuffer(new_data, dtype=np.uint8)
+        delta = old ^ new
+        changed = np.flatnonzero(delta)
+        out = np.frombuffer(ciphertext, dtype=np.uint8).copy()
+        if len(changed) == 0:
+            return out.tobytes()
+
+        if mode == 'ctr':
+            out[:len(delta)] ^= delta
+            return out.tobytes()
+
+        # ECB / CBC: same length, so the PKCS7 padding is the same as before
+        first = changed[0] // 16
+        pad_len = 16 - (len(new) % 16)
+        tail = np.concatenate([new[16 * first:], np.full(pad_len, pad_len, dtype=np.uint8)])
+
+        if mode == 'cbc':
+            prev = bytes(iv) if first == 0 else out[16 * (first - 1):16 * first].tobytes()
+            out[16 * first:] = np.frombuffer(self.encrypt_cbc(tail, prev), dtype=np.uint8)
+        elif mode == 'ecb':
+            blocks = np.unique(changed // 16)
+            out.reshape(-1, 16)[blocks] = self.encrypt_blocks(tail.reshape(-1, 16)[blocks - first])
+        else:
+            raise ValueError(f'Unsupported mode: {mode}')
+        return out.tobytes()
 
     def inv_sub_bytes(self, state):
         for r in range(4):
@@ -219,13 +638,17 @@ class AESCipher:
             s2 = state[2][c]
             s3 = state[3][c]
 
-            state[0][c] = self.gmul(0x0e, s0) ^ self.gmul(0x0b, s1) ^ self.gmul(0x0d, s2) ^ self.gmul(0x09, s3)
-            state[1][c] = self.gmul(0x09, s0) ^ self.gmul(0x0e, s1) ^ self.gmul(0x0b, s2) ^ self.gmul(0x0d, s3)
-            state[2][c] = self.gmul(0x0d, s0) ^ self.gmul(0x09, s1) ^ self.gmul(0x0e, s2) ^ self.gmul(0x0b, s3)
-            state[3][c] = self.gmul(0x0b, s0) ^ self.gmul(0x0d, s1) ^ self.gmul(0x09, s2) ^ self.gmul(0x0e, s3)
+            state[0][c] = _MUL14[s0] ^ _MUL11[s1] ^ _MUL13[s2] ^ _MUL9[s3]
+            state[1][c] = _MUL9[s0] ^ _MUL14[s1] ^ _MUL11[s2] ^ _MUL13[s3]
+            state[2][c] = _MUL13[s0] ^ _MUL9[s1] ^ _MUL14[s2] ^ _MUL11[s3]
+            state[3][c] = _MUL11[s0] ^ _MUL13[s1] ^ _MUL9[s2] ^ _MUL14[s3]
         return state
 
     def decrypt_block(self, input_block):
+        return self.decrypt_block_fast(input_block)
+
+    def decrypt_block_reference(self, input_block):
+        """Step-by-step inverse cipher on the 4x4 state (kept for reference/teaching)."""
         state = [[0] * self.Nb for _ in range(4)]
         for r in range(4):
             for c in range(self.Nb):
@@ -257,11 +680,11 @@ class AESCipher:
         return output
 
     def decrypt_data(self, data):
-        decrypted_data = bytearray()
-        for i in range(0, len(data), 16):
-            block = list(data[i:i+16])
-            decrypted_block = self.decrypt_block(block)
-            decrypted_data.extend(decrypted_block)
+        if len(data) % 16 != 0:
+            raise ValueError('Ciphertext length must be a multiple of 16 bytes.')
+
+        blocks = np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+        decrypted_data = self.decrypt_blocks(blocks).tobytes()
         
         # Unpadding (PKCS7)
         if len(decrypted_data) > 0:
@@ -273,3 +696,230 @@ class AESCipher:
                     return bytes(decrypted_data[:-pad_len])
         
         return bytes(decrypted_data)
+
+
+# --- Streaming Contexts ---
+# Blocks handed to the batch engine per step while streaming (1 MiB)
+STREAM_CHUNK_BLOCKS = 65536
+STREAM_MODES = ('ecb', 'cbc', 'ctr')
+
+
+class StreamContext:
+    """
+    Incremental encryption/decryption (see AESCipher.encryptor / decryptor).
+
+    update()/update_into() process whole blocks as they arrive and keep at most
+    one block buffered: the partial tail, or for padded decryption the last full
+    block (it may hold the PKCS7 padding). finalize() flushes it. ECB and CBC use
+    PKCS7 padding like encrypt_data/decrypt_data; CTR needs none.
+    """
+
+    def __init__(self, cipher, mode, decrypt, iv=None):
+        if mode not in STREAM_MODES:
+            raise ValueError(f'Unsupported mode: {mode}')
+        if mode != 'ecb' and (iv is None or len(iv) != 16):
+            raise ValueError(f'{mode.upper()} mode needs a 16-byte IV.')
+        self.cipher = cipher
+        self.mode = mode
+        self.decrypt = decrypt
+        self.iv = None if iv is None else bytes(iv)
+        self._hold_last_block = decrypt and mode != 'ctr'
+        self._buffer = bytearray()
+        self._counter = 0  # CTR: next keystream block index
+        self._finalized = False
+
+    def _process(self, blocks):
+        """Runs an (N, 16) uint8 array through the mode, advancing the chaining state."""
+        cipher = self.cipher
+        if self.mode == 'ctr':
+            out = blocks ^ cipher.ctr_keystream(self.iv, self._counter, len(blocks))
+            self._counter += len(blocks)
+            return out
+        if self.mode == 'ecb':
+            return cipher.decrypt_blocks(blocks) if self.decrypt else cipher.encrypt_blocks(blocks)
+        if self.decrypt:
+            out = np.frombuffer(cipher.decrypt_cbc(blocks.reshape(-1), self.iv), dtype=np.uint8)
+            self.iv = blocks[-1].tobytes()
+        else:
+            out = np.frombuffer(cipher.encrypt_cbc(blocks.reshape(-1), self.iv), dtype=np.uint8)
+            self.iv = out[-16:].tobytes()
+        return out
+
+    def update_into(self, data, out):
+        """
+        Processes `data` and writes the output into the writable buffer `out`
+        (needs len(data) + 15 bytes of room). Returns the number of bytes written.
+        """
+        if self._finalized:
+            raise ValueError('Context already finalized.')
+        data = memoryview(data).cast('B')
+        out_arr = np.frombuffer(out, dtype=np.uint8)
+        written = 0
+
+        # Complete the buffered block first
+        if self._buffer:
+            take = min(16 - len(self._buffer), len(data))
+            self._buffer += data[:take]
+            data = data[take:]
+            if len(self._buffer) == 16 and (len(data) or not self._hold_last_block):
+                block = np.frombuffer(bytes(self._buffer), dtype=np.uint8).reshape(1, 16)
+                out_arr[:16] = self._process(block).reshape(-1)
+                written = 16
+                self._buffer.clear()
+
+        # Whole blocks straight from the input, in bounded batches
+        num_blocks = len(data) // 16
+        if self._hold_last_block and num_blocks and len(data) % 16 == 0:
+            num_blocks -= 1
+        blocks = np.frombuffer(data, dtype=np.uint8)[:16 * num_blocks].reshape(-1, 16)
+        for i in range(0, num_blocks, STREAM_CHUNK_BLOCKS):
+            chunk = self._process(blocks[i:i + STREAM_CHUNK_BLOCKS]).reshape(-1)
+            out_arr[written:written + len(chunk)] = chunk
+            written += len(chunk)
+
+        self._buffer += data[16 * num_blocks:]
+        return written
+
+    def update(self, data):
+        """Processes `data`, returning the output bytes available so far."""
+        out = bytearray(len(data) + 16)
+        written = self.update_into(data, out)
+        return bytes(memoryview(out)[:written])
+
+    def finalize(self):
+        """Flushes the buffered block (adding or removing padding). Returns the last bytes."""
+        if self._finalized:
+            raise ValueError('Context already finalized.')
+        self._finalized = True
+        tail = bytes(self._buffer)
+        self._buffer.clear()
+
+        if self.mode == 'ctr':
+            return self.cipher.encrypt_ctr(tail, self.iv, 16 * self._counter)
+
+        if not self.decrypt:
+            # Padding (PKCS7)
+            pad_len = 16 - len(tail)
+            block = np.frombuffer(tail + bytes([pad_len] * pad_len), dtype=np.uint8).reshape(1, 16)
+            return self._process(block).tobytes()
+
+        if not tail:
+            return b''
+        if len(tail) != 16:
+            raise ValueError('Ciphertext length must be a multiple of 16 bytes.')
+        last = self._process(np.frombuffer(tail, dtype=np.uint8).reshape(1, 16)).tobytes()
+
+        # Unpadding (PKCS7)
+        pad_len = last[-1]
+        if 0 < pad_len <= 16 and all(p == pad_len for p in last[-pad_len:]):
+            return last[:-pad_len]
+        return last
+
+# --- Multi-Key Batch Engine ---
+_RCON = (0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1b, 0x36)
+
+
+def expand_keys(keys, sbox):
+    """
+    Key expansion for K keys of the same length at once.
+    `keys` is a (K, 16|24|32) uint8 array (or list of byte strings); returns the
+    round keys as a (K, Nr+1, 16) uint8 array in block layout (same as
+    AESCipher.round_keys for each key).
+    """
+    if not isinstance(keys, np.ndarray):
+        keys = [bytes(k) for k in keys]
+        if len({len(k) for k in keys}) != 1:
+            raise ValueError('Keys must all have the same length.')
+        keys = np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(len(keys), -1)
+    if keys.ndim != 2 or keys.shape[1] not in (16, 24, 32):
+        raise ValueError('Keys must all be 16, 24 or 32 bytes long.')
+
+    sbox = np.asarray(sbox, dtype=np.uint8)
+    Nk = keys.shape[1] // 4
+    Nr = Nk + 6
+    total = 4 * (Nr + 1)
+
+    # w[k, i] is word i of key k as 4 bytes (big-endian, like AESCipher.w)
+    w = np.empty((len(keys), total, 4), dtype=np.uint8)
+    w[:, :Nk] = keys.reshape(-1, Nk, 4)
+    for i in range(Nk, total):
+        temp = w[:, i - 1]
+        if i % Nk == 0:
+            temp = sbox[np.roll(temp, -1, axis=1)]  # SubWord(RotWord)
+            temp[:, 0] ^= _RCON[i // Nk]
+        elif Nk > 6 and i % Nk == 4:
+            temp = sbox[temp]
+        w[:, i] = w[:, i - Nk] ^ temp
+    return w.reshape(len(keys), Nr + 1, 16)
+
+
+class MultiKeyCipher:
+    """
+    Encrypts the same data under K keys (one S-Box) in one vectorized pass,
+    e.g. for key-sensitivity experiments. All keys must have the same length.
+    """
+
+    def __init__(self, keys, sbox=None):
+        # Default AES S-Box if none provided
+        self.sbox = list(AES_SBOX) if sbox is None else [int(x) for x in sbox]
+        self.sbox16 = _pair_table(self.sbox)
+        self.round_keys = expand_keys(keys, self.sbox)
+        self.Nr = self.round_keys.shape[1] - 1
+
+    def __len__(self):
+        return len(self.round_keys)
+
+    def encrypt_blocks(self, blocks):
+        """
+        ECB-encrypts N blocks under every key. `blocks` is an (N, 16) uint8 array
+        (or anything reshapeable to it). Returns a (K, N, 16) uint8 array.
+        """
+        blocks = np.asarray(blocks, dtype=np.uint8).reshape(-1, 16)
+        num_keys, n = len(self.round_keys), len(blocks)
+        rk = self.round_keys[:, :, None, :]  # Broadcast each key's round key over its N blocks
+
+        state = (blocks[None] ^ rk[:, 0]).reshape(-1, 16)
+        for round_num in range(1, self.Nr):
+            state = _lookup(self.sbox16, np.take(state, _SHIFT_ROWS, axis=1))  # ShiftRows + SubBytes
+            state = _mix_columns_batch(state)
+            state.reshape(num_keys, n, 16)[...] ^= rk[:, round_num]
+
+        state = _lookup(self.sbox16, np.take(state, _SHIFT_ROWS, axis=1))
+        state = state.reshape(num_keys, n, 16)
+        state ^= rk[:, self.Nr]
+        return state
+
+    def encrypt_data(self, data):
+        """ECB + PKCS7 like AESCipher.encrypt_data, under every key. Returns a (K, len) uint8 array."""
+        pad_len = 16 - (len(data) % 16)
+        padded = bytes(data) + bytes([pad_len] * pad_len)
+        return self.encrypt_blocks(np.frombuffer(padded, dtype=np.uint8)).reshape(len(self), -1)
+
+
+# --- Shared Cipher Instances ---
+# AESCipher is read-only after __init__, so one instance per (key, S-Box) can
+# serve every request in a worker. Bounded LRU; the lock covers both threads.
+CIPHER_CACHE_SIZE = 64
+_CIPHER_CACHE = OrderedDict()
+_CIPHER_CACHE_LOCK = threading.Lock()
+
+
+def get_cipher(key, sbox=None):
+    """
+    Returns a cached AESCipher for this key and S-Box (key schedule, T-Tables and
+    batch tables are built once). Do not modify the returned instance.
+    """
+    cache_key = (bytes(key), None if sbox is None else sbox_fingerprint(sbox))
+    with _CIPHER_CACHE_LOCK:
+        cipher = _CIPHER_CACHE.get(cache_key)
+        if cipher is not None:
+            _CIPHER_CACHE.move_to_end(cache_key)
+            return cipher
+
+    # Build outside the lock; a racing duplicate is harmless
+    cipher = AESCipher(bytes(key), sbox)
+    with _CIPHER_CACHE_LOCK:
+        _CIPHER_CACHE[cache_key] = cipher
+        while len(_CIPHER_CACHE) > CIPHER_CACHE_SIZE:
+            _CIPHER_CACHE.popitem(last=False)
+    return cipher
@@ -1,15 +1,17 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from sbox_analyzer import (get_sbox, check_bijective, check_balance, calculate_nonlinearity, 
-                           calculate_sac, calculate_bic_nl, calculate_bic_sac, calculate_lap, 
-                           calculate_dap, calculate_differential_uniformity, calculate_algebraic_degree,
-                           calculate_transparency_order, calculate_correlation_immunity,
-                           get_ddt_table, get_lat_table, 
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
+from sbox_analyzer import (get_sbox, check_bijective, check_balance,
+                           analyze_sbox, analyze_sboxes, get_analysis_tables,
                            encrypt_image_data, decrypt_image_data, construct_sbox_from_matrix, 
-                           calculate_entropy, calculate_npcr, calculate_uaci,
-                           get_construction_steps, AES_SBOX, SBOX_44)
-from aes_cipher import AESCipher
+                           construct_sboxes_from_matrices,
+                           analyze_key_sensitivity,
+                           calculate_entropy_array, calculate_correlation_array, ImagePipeline, random_flip_positions, summarize_distribution,
+                           get_construction_steps,
+                           THUMBNAIL_BUDGET, FULL_RESOLUTION_PIXEL_BUDGET, AES_SBOX, SBOX_44)
+from aes_cipher import get_cipher, STREAM_MODES
+from werkzeug.utils import secure_filename
 from aes import AESInput, build_workbook, list16_to_matrix4x4_columnmajor
 import base64
+import os
 import pandas as pd
 import io
 from openpyxl import Workbook
@@ -72,6 +74,91 @@ def get_key_from_request(req):
         key_bytes = key_bytes[:16]
     return key_bytes
 
+def parse_sbox_list(sbox_input):
+    """Parses a JSON S-Box (list of 256 ints or hex/decimal strings). Returns (sbox, error)."""
+    sbox = []
+    if isinstance(sbox_input, list):
+        for x in sbox_input:
+            if isinstance(x, str):
+                if x.lower().startswith('0x'):
+                    sbox.append(int(x, 16))
+                else:
+                     # Try parsing as decimal string (or hex without prefix?)
+                    try:
+                        sbox.append(int(x))
+                    except:
+                        # Try hex without prefix
+                        try: 
+                            sbox.append(int(x, 16))
+                        except:
+                            return None, f'Invalid value in S-Box: {x}'
+            elif isinstance(x, int):
+                sbox.append(x)
+            else:
+                 return None, f'Invalid value in S-Box: {x}'
+    else:
+         return None, 'S-Box must be a list.'
+
+    if len(sbox) != 256:
+         return None, f'S-Box must have 256 values. Got {len(sbox)}.'
+
+    if any(x < 0 or x > 255 for x in sbox):
+         return None, 'S-Box values must be between 0 and 255.'
+
+    return sbox, None
+
+def get_pixel_budget(req):
+    """
+    Pixel budget for image endpoints.
+    'max_pixels' sets an explicit budget (capped at 4K), 'full_resolution' selects the 4K budget.
+    Returns (budget, error).
+    """
+    max_pixels = req.form.get('max_pixels')
+    if max_pixels:
+        try:
+            max_pixels = int(max_pixels)
+        except ValueError:
+            return None, 'max_pixels must be an integer.'
+        if max_pixels < 1:
+            return None, 'max_pixels must be a positive integer.'
+        return min(max_pixels, FULL_RESOLUTION_PIXEL_BUDGET), None
+    if req.form.get('full_resolution', '').lower() in ('true', '1', 'on'):
+        return FULL_RESOLUTION_PIXEL_BUDGET, None
+    return THUMBNAIL_BUDGET, None
+
+def parse_polynomial(polynomial):
+    """Parses a modulus polynomial given as int, '0x11B' or '283' (falls back to 0x11B)."""
+    if isinstance(polynomial, str):
+        try:
+            if polynomial.lower().startswith('0x'):
+                return int(polynomial, 16)
+            return int(polynomial)
+        except:
+            return 0x11B # Fallback
+    return polynomial
+
+def validate_affine_input(affine_matrix, c_constant):
+    """Returns an error message for a malformed 8x8 matrix / 8-bit constant, else None."""
+    if not affine_matrix:
+        return 'Affine matrix is required.'
+    
+    # Validate matrix dimensions
+    if len(affine_matrix) != 8:
+        return 'Affine matrix must have 8 rows.'
+    for row in affine_matrix:
+        if len(row) != 8:
+            return 'Each row must have 8 elements.'
+        if any(val not in [0, 1] for val in row):
+            return 'Matrix elements must be 0 or 1.'
+    
+    # Validate constant if provided
+    if c_constant:
+        if len(c_constant) != 8:
+            return 'Constant must have 8 elements.'
+        if any(val not in [0, 1] for val in c_constant):
+            return 'Constant elements must be 0 or 1.'
+    return None
+
 def generate_excel_report(trace_data, key, sbox):
     wb = Workbook()
     ws = wb.active
@@ -127,39 +214,17 @@ def analyze():
         if error:
             return jsonify({'error': error}), 400
 
-        # Perform Analysis
-        is_bijective = check_bijective(sbox)
-        balance_results = check_balance(sbox)
-        nl = calculate_nonlinearity(sbox)
-        sac = calculate_sac(sbox)
-        bic_nl = calculate_bic_nl(sbox)
-        bic_sac = calculate_bic_sac(sbox)
-        lap = calculate_lap(sbox)
-        dap = calculate_dap(sbox)
-        du = calculate_differential_uniformity(sbox)
-        ad = calculate_algebraic_degree(sbox)
-        to = calculate_transparency_order(sbox)
-        ci = calculate_correlation_immunity(sbox)
+        # Perform Analysis (cached per S-Box)
+        analysis = analyze_sbox(sbox)
         
         # Format S-Box for display (Hex)
         sbox_hex = [f'{x:02X}' for x in sbox]
         
         return jsonify({
             'sbox': sbox_hex,
-            'is_bijective': is_bijective,
-            'balance_results': balance_results,
-            'metrics': {
-                'nl': nl,
-                'sac': sac,
-                'bic_nl': bic_nl,
-                'bic_sac': bic_sac,
-                'lap': lap,
-                'dap': dap,
-                'du': du,
-                'ad': ad,
-                'to': to,
-                'ci': ci
-            }
+            'is_bijective': analysis['is_bijective'],
+            'balance_results': analysis['balance_results'],
+            'metrics': analysis['metrics']
         })
 
     except Exception as e:
@@ -180,13 +245,8 @@ def analyze_advanced():
         if not sbox:
             return jsonify({'error': 'Invalid S-Box.'}), 400
             
-        ddt = get_ddt_table(sbox)
-        lat = get_lat_table(sbox)
-        
-        return jsonify({
-            'ddt': ddt,
-            'lat': lat
-        })
+        # DDT, LAT, SAC and BIC-SAC matrices (cached per S-Box)
+        return jsonify(get_analysis_tables(sbox))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -226,7 +286,7 @@ def avalanche_check():
             block += [0] * (16 - len(block))
             
         # Encrypt Original
-        cipher = AESCipher(key_bytes, sbox)
+        cipher = get_cipher(key_bytes, sbox)
         original_ct = cipher.encrypt_block(block)
         
         # Flip Bit
@@ -278,6 +338,46 @@ def avalanche_check():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+MAX_KEY_SENSITIVITY_BYTES = 4096
+
+@app.route('/key_sensitivity', methods=['POST'])
+def key_sensitivity():
+    """
+    Key sensitivity: ciphertext Hamming distance for every single-bit key flip.
+    Form fields: 'type' / 'custom_sbox', 'key', 'text_input' (plaintext, ECB + PKCS7)
+    and optional 'bits' (comma-separated key bit indices, default all 128).
+    """
+    try:
+        sbox_type = request.form.get('type')
+        custom_sbox_str = request.form.get('custom_sbox')
+        text_input = request.form.get('text_input', '')
+        bits_input = request.form.get('bits')
+
+        sbox, error = parse_sbox_input(sbox_type, custom_sbox_str)
+        if error:
+            return jsonify({'error': error}), 400
+
+        data_bytes = text_input.encode('utf-8')
+        if len(data_bytes) > MAX_KEY_SENSITIVITY_BYTES:
+            return jsonify({'error': f'Plaintext is limited to {MAX_KEY_SENSITIVITY_BYTES} bytes.'}), 400
+
+        bits = None
+        if bits_input:
+            try:
+                bits = [int(b) for b in bits_input.split(',') if b.strip()]
+            except ValueError:
+                return jsonify({'error': 'Bits must be comma-separated integers.'}), 400
+
+        try:
+            result = analyze_key_sensitivity(get_key_from_request(request), sbox, data_bytes, bits)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/encrypt', methods=['POST'])
 def encrypt():
     try:
@@ -286,7 +386,10 @@ def encrypt():
         text_input = request.form.get('text_input')
         key_input = request.form.get('key')
         image_file = request.files.get('image_file') # New field
-        encryption_mode = request.form.get('encryption_mode', 'ecb') # 'ecb' or 'substitution'
+        encryption_mode = request.form.get('encryption_mode', 'ecb') # 'ecb', 'cbc', 'ctr' or 'substitution'
+        max_pixels, error = get_pixel_budget(request)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Get S-Box
         sbox, error = parse_sbox_input(sbox_type, custom_sbox_str)
@@ -307,13 +410,13 @@ def encrypt():
             elif len(key_bytes) < 32: key_bytes = key_bytes[:24]
             else: key_bytes = key_bytes[:32]
 
-        cipher = AESCipher(key_bytes, sbox)
+        cipher = get_cipher(key_bytes, sbox)
 
         # Handle Image Encryption
         if image_file:
             image_bytes = image_file.read()
             # Pass Raw Key + Format to Analyzer
-            encrypted_b64, hist_orig, hist_enc, _ = encrypt_image_data(image_bytes, sbox, key_input, encryption_mode, key_format)
+            encrypted_b64, hist_orig, hist_enc, _ = encrypt_image_data(image_bytes, sbox, key_input, encryption_mode, key_format, max_pixels)
             
             if not encrypted_b64:
                  # If analyzer failed (e.g. hex error inside), it returns None
@@ -334,17 +437,35 @@ def encrypt():
         elif text_input:
              # Text Encryption Logic (Legacy)
              data = text_input.encode('utf-8')
-             encrypted_bytes = cipher.encrypt_data(data)
+             if encryption_mode == 'ctr':
+                 # CTR: random IV prepended to the ciphertext, no padding
+                 iv = os.urandom(16)
+                 encrypted_bytes = iv + cipher.encrypt_ctr(data, iv)
+             else:
+                 encrypted_bytes = cipher.encrypt_data(data)
              encrypted_hex = encrypted_bytes.hex().upper()
              
-             # Trace
-             block = list(data[:16])
-             if len(block) < 16: block += [0] * (16 - len(block))
-             _, trace = cipher.encrypt_block(block, trace=True)
+             # Trace ('trace_format=compact' skips building the nested dicts).
+             # CTR never runs the plaintext through AES: trace the first counter
+             # block (the IV), whose output is keystream block 0.
+             if encryption_mode == 'ctr':
+                 block, trace_block = list(iv), 'keystream'
+             else:
+                 block, trace_block = list(data[:16]), 'plaintext'
+                 if len(block) < 16: block += [0] * (16 - len(block))
+             _, recorder = cipher.encrypt_block_traced(block)
+             
+             if request.form.get('trace_format') == 'compact':
+                 return jsonify({
+                     'encrypted_text': encrypted_hex,
+                     'trace_block': trace_block,
+                     'trace_compact': recorder.to_compact()
+                 })
              
              return jsonify({
                  'encrypted_text': encrypted_hex,
-                 'trace_data': trace
+                 'trace_block': trace_block,
+                 'trace_data': recorder.to_dicts()
              })
 
         else:
@@ -375,9 +496,14 @@ def decrypt():
             
         # Get Key
         key = get_key_from_request(request)
-        cipher = AESCipher(key, sbox)
+        cipher = get_cipher(key, sbox)
         
-        decrypted_bytes = cipher.decrypt_data(ciphertext_bytes)
+        if request.form.get('encryption_mode', 'ecb') == 'ctr':
+            if len(ciphertext_bytes) < 16:
+                return jsonify({'error': 'CTR ciphertext must start with a 16-byte IV.'}), 400
+            decrypted_bytes = cipher.decrypt_ctr(ciphertext_bytes[16:], ciphertext_bytes[:16])
+        else:
+            decrypted_bytes = cipher.decrypt_data(ciphertext_bytes)
         
         try:
             decrypted_text = decrypted_bytes.decode('utf-8')
@@ -464,11 +590,17 @@ def encrypt_detailed():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+MAX_SWEEP_POSITIONS = 500
+
 @app.route('/analyze_image_sensitivity', methods=['POST'])
 def analyze_image_sensitivity():
     """
     Perform deep image analysis (Entropy & NPCR).
     Requires: image, key, sbox.
+    Optional 'sweep' (N) adds NPCR/UACI statistics over N random single-bit
+    flips ('sweep_seed' makes the positions reproducible).
+    Adjacent-pixel correlation uses every pair, or 'correlation_samples' random
+    pairs per direction for large images.
     """
     try:
         sbox_type = request.form.get('type')
@@ -477,79 +609,75 @@ def analyze_image_sensitivity():
         key_input = request.form.get('key')
         key_format = request.form.get('key_format', 'text')
         encryption_mode = request.form.get('encryption_mode', 'ecb')
+        max_pixels, error = get_pixel_budget(request)
+        if error:
+            return jsonify({'error': error}), 400
+        try:
+            sweep_count = int(request.form.get('sweep') or 0)
+            sweep_seed = request.form.get('sweep_seed')
+            sweep_seed = int(sweep_seed) if sweep_seed else None
+        except ValueError:
+            return jsonify({'error': 'Sweep size and seed must be integers.'}), 400
+        try:
+            correlation_samples = request.form.get('correlation_samples')
+            correlation_samples = int(correlation_samples) if correlation_samples else None
+        except ValueError:
+            return jsonify({'error': 'Correlation samples must be an integer.'}), 400
 
         if not image_file:
              return jsonify({'error': 'Image file required.'}), 400
+        if not 0 <= sweep_count <= MAX_SWEEP_POSITIONS:
+             return jsonify({'error': f'Sweep size must be between 0 and {MAX_SWEEP_POSITIONS}.'}), 400
+        if sweep_seed is not None and sweep_seed < 0:
+             return jsonify({'error': 'Sweep seed must not be negative.'}), 400
+        if correlation_samples is not None and correlation_samples <= 0:
+             return jsonify({'error': 'Correlation samples must be a positive integer.'}), 400
              
         sbox, error = parse_sbox_input(sbox_type, custom_sbox_str)
         if error: return jsonify({'error': error}), 400
         
         if not key_input: key_input = "This is a key123"
-        
-        # We pass key_input and key_format directly to encrypt_image_data
-        # Note: We need key_bytes only if we manually perform something here not using sbox_analyzer functions
-        # But wait, analyze_image_sensitivity does logic locally using sbox_analyzer functions.
-        # But 'encrypt_image_data' now handles the key parsing.
-        # So we don't need to parse it here? But wait...
-        # 'calculate_entropy' takes ciphertext. 'calculate_npcr' takes 2 ciphertexts.
-        # All good.
-        
-        # However, we need 'key_bytes' passed to encrypt_image_data?
-        # NO, we updated encrypt_image_data to take (bytes, sbox, key_INPUT, mode, format).
-        # So we pass 'key_input' string.
 
-        # Read Original Image
-        image_bytes = image_file.read()
-        
-        # 0. Pre-process: Resize to ensure 1-bit change persists.
-        # encrypt_image_data resizes to max 256x256. We must do this BEFORE flipping a bit.
-        from PIL import Image
-        import numpy as np
-        
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Resize if too large, similar to encrypt_image_data logic
-        # Reduced to 128px for faster deployment processing
-        max_dim = 128
-        if img.width > max_dim or img.height > max_dim:
-            img.thumbnail((max_dim, max_dim))
-            
-        # Get processed base bytes
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        processed_image_bytes = buf.getvalue()
-        
-        # 1. Encrypt Original (Processed) -> C1
-        c1_b64, _, _, c1_bytes_raw = encrypt_image_data(processed_image_bytes, sbox, key_input, encryption_mode, key_format)
+        # Decode + resize once; every stage below works on the pixel arrays.
+        # The resize happens BEFORE flipping a bit, so the 1-bit change persists.
+        pipeline = ImagePipeline(image_file.read(), sbox, key_input, encryption_mode, key_format, max_pixels)
         
-        # 2. Calculate Entropy
-        original_entropy = calculate_entropy(processed_image_bytes)
-        encrypted_entropy = calculate_entropy(c1_bytes_raw)
+        # 1. Entropy of the original and of its encryption (C1)
+        original_entropy = calculate_entropy_array(pipeline.pixels)
+        encrypted_entropy = calculate_entropy_array(pipeline.encrypted)
         
-        # 3. Modify Image (Flip 1 bit of processed image) -> P2
-        arr = np.array(img)
-        # Flip LSB of first pixel
-        arr_mod = arr.copy()
-        arr_mod[0,0,0] ^= 1 
+        # 2. NPCR & UACI: flip LSB of first pixel -> P2, encrypt -> C2, compare with C1
+        npcr, uaci = pipeline.sensitivity(0, 0, 0, bit=0)
         
-        img_mod = Image.fromarray(arr_mod)
-        buf_mod = io.BytesIO()
-        img_mod.save(buf_mod, format='PNG')
-        image_mod_bytes = buf_mod.getvalue()
+        # 3. Adjacent-pixel correlation of plaintext and ciphertext
+        correlation = {
+            'original': calculate_correlation_array(pipeline.pixels, correlation_samples),
+            'encrypted': calculate_correlation_array(pipeline.encrypted, correlation_samples)
+        }
         
-        # 4. Encrypt Modified -> C2
-        c2_b64, _, _, c2_bytes_raw = encrypt_image_data(image_mod_bytes, sbox, key_input, encryption_mode, key_format)
-        
-        # 5. Calculate Metrics (NPCR & UACI)
-        npcr = calculate_npcr(c1_bytes_raw, c2_bytes_raw)
-        uaci = calculate_uaci(c1_bytes_raw, c2_bytes_raw)
-        
-        return jsonify({
+        result = {
             'original_entropy': original_entropy,
             'entropy': encrypted_entropy,
             'npcr': npcr,
-            'uaci': uaci
-        })
+            'uaci': uaci,
+            'correlation': correlation
+        }
+        
+        # 4. Optional sweep: N random flips against the same C1, one batched job
+        if sweep_count:
+            positions = random_flip_positions(pipeline.pixels.shape, sweep_count, sweep_seed)
+            npcr_values, uaci_values = pipeline.sensitivity_sweep(positions)
+            result['sweep'] = {
+                'count': sweep_count,
+                'npcr': summarize_distribution(npcr_values),
+                'uaci': summarize_distribution(uaci_values),
+                'positions': [
+                    {'y': int(y), 'x': int(x), 'channel': int(c), 'bit': int(b), 'npcr': float(n), 'uaci': float(u)}
+                    for (y, x, c, b), n, u in zip(positions, npcr_values, uaci_values)
+                ]
+            }
+        
+        return jsonify(result)
 
     except Exception as e:
         import traceback
@@ -603,36 +731,11 @@ def construct():
         c_constant = data.get('c_constant')
 
         sample_inputs = data.get('sample_inputs', [0, 15, 255])
-        polynomial = data.get('polynomial', 0x11B) # Default to Standard AES
-        
-        # Parse polynomial if string
-        if isinstance(polynomial, str):
-            try:
-                if polynomial.lower().startswith('0x'):
-                    polynomial = int(polynomial, 16)
-                else:
-                    polynomial = int(polynomial)
-            except:
-                polynomial = 0x11B # Fallback
+        polynomial = parse_polynomial(data.get('polynomial', 0x11B)) # Default to Standard AES
         
-        if not affine_matrix:
-            return jsonify({'error': 'Affine matrix is required.'}), 400
-        
-        # Validate matrix dimensions
-        if len(affine_matrix) != 8:
-            return jsonify({'error': 'Affine matrix must have 8 rows.'}), 400
-        for row in affine_matrix:
-            if len(row) != 8:
-                return jsonify({'error': 'Each row must have 8 elements.'}), 400
-            if any(val not in [0, 1] for val in row):
-                return jsonify({'error': 'Matrix elements must be 0 or 1.'}), 400
-        
-        # Validate constant if provided
-        if c_constant:
-            if len(c_constant) != 8:
-                return jsonify({'error': 'Constant must have 8 elements.'}), 400
-            if any(val not in [0, 1] for val in c_constant):
-                return jsonify({'error': 'Constant elements must be 0 or 1.'}), 400
+        error = validate_affine_input(affine_matrix, c_constant)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Construct S-box
         import numpy as np
@@ -673,6 +776,53 @@ def construct():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/construct_batch', methods=['POST'])
+def construct_batch():
+    """
+    Construct many S-boxes from a stack of affine matrices in one request.
+    Expects JSON with:
+    - affine_matrices: list of 8x8 arrays
+    - c_constants: list of 8-element arrays or null (optional, null entries default to C_AES)
+    - polynomial: modulus shared by all matrices (optional, default: 0x11B)
+    """
+    try:
+        data = request.json
+        affine_matrices = data.get('affine_matrices')
+        c_constants = data.get('c_constants')
+        polynomial = parse_polynomial(data.get('polynomial', 0x11B))
+        
+        if not affine_matrices:
+            return jsonify({'error': 'At least one affine matrix is required.'}), 400
+        if c_constants is None:
+            c_constants = [None] * len(affine_matrices)
+        if len(c_constants) != len(affine_matrices):
+            return jsonify({'error': 'Need one constant (or null) per affine matrix.'}), 400
+        
+        for i, (affine_matrix, c_constant) in enumerate(zip(affine_matrices, c_constants)):
+            error = validate_affine_input(affine_matrix, c_constant)
+            if error:
+                return jsonify({'error': f'Matrix {i}: {error}'}), 400
+        
+        # Empty constants behave like /construct (default C_AES)
+        c_constants = [c if c else None for c in c_constants]
+        sboxes = construct_sboxes_from_matrices(affine_matrices, c_constants, mod_poly=polynomial)
+        
+        results = []
+        for sbox in sboxes.tolist():
+            is_bijective = check_bijective(sbox)
+            balance_results = check_balance(sbox)
+            results.append({
+                'sbox': [f'{x:02X}' for x in sbox],
+                'sbox_values': sbox,
+                'is_bijective': is_bijective,
+                'valid': is_bijective and all(r['is_balanced'] for r in balance_results)
+            })
+        
+        return jsonify({'results': results})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/trace_input', methods=['POST'])
 def trace_input():
     """
@@ -957,57 +1107,133 @@ def analyze_sbox_endpoint():
         if not sbox_input:
              return jsonify({'error': 'S-Box data is required.'}), 400
              
-        # Parse S-Box (handle hex strings or ints)
-        sbox = []
-        if isinstance(sbox_input, list):
-            for x in sbox_input:
-                if isinstance(x, str):
-                    if x.lower().startswith('0x'):
-                        sbox.append(int(x, 16))
-                    else:
-                         # Try parsing as decimal string (or hex without prefix?)
-                        try:
-                            sbox.append(int(x))
-                        except:
-                            # Try hex without prefix
-                            try: 
-                                sbox.append(int(x, 16))
-                            except:
-                                return jsonify({'error': f'Invalid value in S-Box: {x}'}), 400
-                elif isinstance(x, int):
-                    sbox.append(x)
-                else:
-                     return jsonify({'error': f'Invalid value in S-Box: {x}'}), 400
-        else:
-             return jsonify({'error': 'S-Box must be a list.'}), 400
-
-        if len(sbox) != 256:
-             return jsonify({'error': f'S-Box must have 256 values. Got {len(sbox)}.'}), 400
+        sbox, error = parse_sbox_list(sbox_input)
+        if error:
+            return jsonify({'error': error}), 400
 
-        # Run Analysis
-        nl = calculate_nonlinearity(sbox)
-        sac = calculate_sac(sbox)
-        bic_nl = calculate_bic_nl(sbox)
-        bic_sac = calculate_bic_sac(sbox)
-        lap = calculate_lap(sbox)
-        dap = calculate_dap(sbox)
-        du = calculate_differential_uniformity(sbox)
+        # Run Analysis (cached per S-Box)
+        metrics = analyze_sbox(sbox)['metrics']
         
         return jsonify({
-            'nl': nl,
-            'sac': sac,
-            'bic_nl': bic_nl,
-            'bic_sac': bic_sac,
-            'lap': lap,
-            'dap': dap,
-            'du': du,
-            'differential_uniformity': du, # Alias for consistency
-            'nonlinearity': nl             # Alias
+            'nl': metrics['nl'],
+            'sac': metrics['sac'],
+            'bic_nl': metrics['bic_nl'],
+            'bic_sac': metrics['bic_sac'],
+            'lap': metrics['lap'],
+            'dap': metrics['dap'],
+            'du': metrics['du'],
+            'differential_uniformity': metrics['du'], # Alias for consistency
+            'nonlinearity': metrics['nl']             # Alias
         })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+STREAM_CHUNK_SIZE = 1 << 20 # Bytes read from the upload per step
+
+def stream_cipher_response(decrypt):
+    """
+    Shared body of /encrypt_stream and /decrypt_stream.
+    Reads the uploaded 'file' in chunks through a streaming context and streams
+    the output back, so memory use does not grow with the file size.
+    CBC/CTR: encryption writes a random IV first, decryption reads it back.
+    """
+    sbox, error = parse_sbox_input(request.form.get('type'), request.form.get('custom_sbox'))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'File required.'}), 400
+    
+    mode = request.form.get('encryption_mode', 'ecb')
+    if mode not in STREAM_MODES:
+        return jsonify({'error': f'Mode must be one of: {", ".join(STREAM_MODES)}.'}), 400
+    
+    cipher = get_cipher(get_key_from_request(request), sbox)
+    source = upload.stream
+    iv = None
+    if mode != 'ecb':
+        iv = source.read(16) if decrypt else os.urandom(16)
+        if len(iv) != 16:
+            return jsonify({'error': 'Input too short to contain an IV.'}), 400
+    
+    # Padded ciphertext must be whole blocks; check now, errors can't be reported once streaming starts
+    if decrypt and mode != 'ctr':
+        start = source.tell()
+        remaining = source.seek(0, os.SEEK_END) - start
+        source.seek(start)
+        if remaining % 16:
+            return jsonify({'error': 'Ciphertext length must be a multiple of 16 bytes.'}), 400
+    context = cipher.decryptor(mode, iv) if decrypt else cipher.encryptor(mode, iv)
+    
+    def generate():
+        if iv is not None and not decrypt:
+            yield iv
+        out = bytearray(STREAM_CHUNK_SIZE + 16)
+        view = memoryview(out)
+        while True:
+            chunk = source.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            written = context.update_into(chunk, out)
+            yield bytes(view[:written])
+        yield context.finalize()
+    
+    suffix = '.dec' if decrypt else '.enc'
+    filename = (secure_filename(upload.filename or '') or 'data') + suffix
+    return Response(stream_with_context(generate()), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/encrypt_stream', methods=['POST'])
+def encrypt_stream():
+    """
+    Encrypts an uploaded file of any size, streaming the ciphertext back.
+    Form fields: file, key, type/custom_sbox, encryption_mode ('ecb', 'cbc' or 'ctr').
+    """
+    try:
+        return stream_cipher_response(decrypt=False)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/decrypt_stream', methods=['POST'])
+def decrypt_stream():
+    """Inverse of /encrypt_stream (same form fields)."""
+    try:
+        return stream_cipher_response(decrypt=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+MAX_BATCH_SBOXES = 512
+
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyzes many S-Boxes in one request (spread over worker processes).
+    Expects JSON with 'sboxes' (list of S-Boxes, each 256 integers or hex strings).
+    Returns 'results' in the same order, each like the /analyze response.
+    """
+    try:
+        data = request.json
+        sboxes_input = data.get('sboxes')
+        
+        if not sboxes_input or not isinstance(sboxes_input, list):
+             return jsonify({'error': 'A list of S-Boxes is required.'}), 400
+        if len(sboxes_input) > MAX_BATCH_SBOXES:
+             return jsonify({'error': f'At most {MAX_BATCH_SBOXES} S-Boxes per batch.'}), 400
+        
+        sboxes = []
+        for i, sbox_input in enumerate(sboxes_input):
+            sbox, error = parse_sbox_list(sbox_input)
+            if error:
+                return jsonify({'error': f'S-Box {i}: {error}'}), 400
+            sboxes.append(sbox)
+        
+        return jsonify({'results': analyze_sboxes(sboxes)})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=False, port=5001)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+AES File Encryption (mmap)
+--------------------------
+Command-line encryption/decryption of large files with AESCipher and a custom
+S-Box, without going through the Flask upload path.
+
+The file is memory-mapped and processed in large aligned chunks by the NumPy
+batch engine. ECB, CTR and CBC decryption chunks are independent, so they are
+spread across worker processes; CBC encryption is a serial chain.
+
+File format:
+- ECB / CBC: PKCS7 padding (same as encrypt_data / decrypt_data).
+- CTR: no padding.
+- CBC / CTR: without --iv a random IV is generated and stored as the first
+  16 bytes of the output (and read back on decryption). With --iv the IV is
+  not stored; --in-place needs --iv for CBC / CTR.
+
+Usage:
+    python file_cipher.py encrypt big.bin -o big.enc --key "secret" --sbox sbox44 --mode ctr
+    python file_cipher.py decrypt big.enc -o big.out --key "secret" --sbox sbox44 --mode ctr
+"""
+import argparse
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from aes_cipher import get_cipher
+from sbox_analyzer import get_sbox
+
+MODES = ('ecb', 'ctr', 'cbc')
+DEFAULT_CHUNK_SIZE = 16 << 20  # 16 MiB: multiple of 16 and of mmap.ALLOCATIONGRANULARITY
+
+
+def normalize_key(key):
+    """Pads / truncates key bytes to an AES key length (16, 24 or 32), like the web app."""
+    if len(key) not in (16, 24, 32):
+        if len(key) < 16: key += b'\0' * (16 - len(key))
+        elif len(key) < 24: key = key[:16]
+        elif len(key) < 32: key = key[:24]
+        else: key = key[:32]
+    return key
+
+
+def load_sbox(spec):
+    """'aes', 'sbox44' or a text file with 256 values (decimal or 0x-hex, comma/space separated)."""
+    sbox = get_sbox(spec)
+    if sbox is not None:
+        return list(sbox)
+
+    parts = Path(spec).read_text().replace(',', ' ').split()
+    sbox = [int(part, 0) for part in parts]
+    if len(sbox) != 256 or sorted(sbox) != list(range(256)):
+        raise ValueError('S-Box file must contain a permutation of 0..255 (256 values).')
+    return sbox
+
+
+def cipher_blocks(data):
+    """Zero-copy (N, 16) uint8 view of block-aligned bytes."""
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 16)
+
+
+def _crypt_range(job):
+    """
+    Processes one chunk: maps input and output, runs the chunk through the
+    batch engine and writes the result in place. Runs in worker processes.
+    """
+    (in_path, out_path, in_start, out_start, length,
+     key, sbox, mode, decrypt, iv, stream_offset) = job
+    cipher = get_cipher(key, sbox)
+
+    with open(in_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as src:
+            data = memoryview(src)[in_start:in_start + length]
+            try:
+                if mode == 'ctr':
+                    result = cipher.encrypt_ctr(data, iv, stream_offset)
+                elif mode == 'cbc':
+                    result = cipher.decrypt_cbc(data, iv)  # Encryption never fans out
+                elif decrypt:
+                    result = cipher.decrypt_blocks(cipher_blocks(data)).tobytes()
+                else:
+                    result = cipher.encrypt_blocks(cipher_blocks(data)).tobytes()
+            finally:
+                data.release()
+
+    with open(out_path, 'r+b') as f:
+        with mmap.mmap(f.fileno(), 0) as dst:
+            dst[out_start:out_start + length] = result
+            dst.flush()
+    return length
+
+
+def _read_at(path, offset, length):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def _write_at(path, offset, data):
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def crypt_file(in_path, out_path, key, sbox, mode='ecb', decrypt=False, iv=None,
+               workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Encrypts or decrypts `in_path` into `out_path` (None = in place).
+    Returns the number of input bytes processed.
+    """
+    if mode not in MODES:
+        raise ValueError(f'Mode must be one of: {", ".join(MODES)}.')
+    if chunk_size <= 0 or chunk_size % mmap.ALLOCATIONGRANULARITY:
+        raise ValueError(f'Chunk size must be a multiple of {mmap.ALLOCATIONGRANULARITY} bytes.')
+
+    in_path = str(in_path)
+    in_place = out_path is None or os.path.abspath(out_path) == os.path.abspath(in_path)
+    out_path = in_path if in_place else str(out_path)
+    key = normalize_key(key)
+    size = os.path.getsize(in_path)
+
+    # IV: given (not stored) or random and stored as a 16-byte header
+    header = 0
+    if mode != 'ecb' and iv is None:
+        if in_place:
+            raise ValueError('--in-place with CBC / CTR needs an explicit --iv.')
+        header = 16
+        iv = _read_at(in_path, 0, 16) if decrypt else os.urandom(16)
+        if len(iv) != 16:
+            raise ValueError('Input too short to contain an IV.')
+
+    padded = mode != 'ctr'
+    in_start, out_start = (header, 0) if decrypt else (0, header)
+    body = size - in_start
+    if decrypt and padded and body % 16:
+        raise ValueError('Ciphertext length must be a multiple of 16 bytes.')
+
+    # Bytes handled by the chunk jobs; encryption pads the tail in this process
+    span = body if (decrypt or not padded) else body - body % 16
+    tail = b'' if span == body else _read_at(in_path, in_start + span, body - span)
+    out_size = out_start + (body - body % 16 + 16 if padded and not decrypt else body)
+
+    if in_place:
+        os.truncate(out_path, max(out_size, size))
+    else:
+        with open(out_path, 'wb') as f:
+            f.truncate(out_size)
+        if header and not decrypt:
+            _write_at(out_path, 0, iv)
+
+    cipher = get_cipher(key, sbox)
+    starts = list(range(0, span, chunk_size))
+
+    if mode == 'cbc' and not decrypt:
+        # Serial chain: each chunk starts from the previous ciphertext block
+        prev = iv
+        for start in starts:
+            length = min(chunk_size, span - start)
+            out = cipher.encrypt_cbc(_read_at(in_path, in_start + start, length), prev)
+            _write_at(out_path, out_start + start, out)
+            prev = out[-16:]
+        iv = prev
+    elif starts:
+        jobs = []
+        for start in starts:
+            length = min(chunk_size, span - start)
+            job_iv = iv
+            if mode == 'cbc':
+                # Chunk IV is the ciphertext block before it; read now, before anything is overwritten
+                job_iv = iv if start == 0 else _read_at(in_path, in_start + start - 16, 16)
+            jobs.append((in_path, out_path, in_start + start, out_start + start, length,
+                         key, sbox, mode, decrypt, job_iv, start))
+
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_crypt_range, jobs))
+        else:
+            for job in jobs:
+                _crypt_range(job)
+
+    if padded and not decrypt:
+        # Padding (PKCS7) on the last, partial block
+        pad_len = 16 - len(tail)
+        last = tail + bytes([pad_len] * pad_len)
+        if mode == 'cbc':
+            last = cipher.encrypt_cbc(last, iv)
+        else:
+            last = cipher.encrypt_blocks(cipher_blocks(last)).tobytes()
+        _write_at(out_path, out_start + span, last)
+    elif padded and body:
+        # Unpadding (PKCS7), same leniency as decrypt_data
+        last = _read_at(out_path, out_start + body - 16, 16)
+        pad_len = last[-1]
+        if 0 < pad_len <= 16 and all(p == pad_len for p in last[-pad_len:]):
+            out_size -= pad_len
+
+    os.truncate(out_path, out_size)
+    return size
+
+
+def main():
+    ap = argparse.ArgumentParser(description="AES file encryption with custom S-Boxes (mmap, multi-process)")
+    ap.add_argument("action", choices=["encrypt", "decrypt"])
+    ap.add_argument("input", type=str, help="Input file")
+    ap.add_argument("-o", "--out", type=str, default=None, help="Output file (omit with --in-place)")
+    ap.add_argument("--in-place", action="store_true", help="Overwrite the input file")
+    ap.add_argument("--key", type=str, default=None, help="Key as text (padded/truncated to 16/24/32 bytes)")
+    ap.add_argument("--key-hex", type=str, default=None, help="Key as hex (16, 24 or 32 bytes)")
+    ap.add_argument("--sbox", type=str, default="aes", help="'aes', 'sbox44' or path to a file with 256 values")
+    ap.add_argument("--mode", choices=MODES, default="ecb")
+    ap.add_argument("--iv", type=str, default=None, help="16-byte IV as hex (CBC/CTR); not stored in the file")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    ap.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_SIZE >> 20, help="Chunk size in MiB")
+    args = ap.parse_args()
+
+    if bool(args.out) == args.in_place:
+        raise SystemExit("Pass exactly one of --out or --in-place.")
+    if args.key_hex:
+        key = bytes.fromhex(args.key_hex)
+    elif args.key:
+        key = args.key.encode('utf-8')
+    else:
+        raise SystemExit("Pass --key or --key-hex.")
+    iv = bytes.fromhex(args.iv) if args.iv else None
+    if iv is not None and len(iv) != 16:
+        raise SystemExit("--iv must be 16 bytes (32 hex characters).")
+
+    start = time.perf_counter()
+    size = crypt_file(args.input, args.out, key, load_sbox(args.sbox), mode=args.mode,
+                      decrypt=args.action == "decrypt", iv=iv, workers=args.workers,
+                      chunk_size=args.chunk_mb << 20)
+    elapsed = time.perf_counter() - start
+
+    mb = size / 1e6
+    print(f"{args.action.capitalize()}ed {mb:.1f} MB ({args.mode.upper()}) in {elapsed:.2f} s: "
+          f"{mb / elapsed if elapsed else float('inf'):.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
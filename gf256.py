@@ -0,0 +1,117 @@
+"""
+GF(2^8) Arithmetic
+------------------
+Shared finite-field helpers for the AES cipher, the S-Box constructor and the
+Excel trace generator.
+
+Multiplication and inversion use log/antilog (exp/log) tables built once per
+modulus polynomial and memoized, so every operation is an O(1) lookup for any
+polynomial sent by the UI (default: AES polynomial 0x11B).
+
+Reducible polynomials do not define a field (no generator exists). For those,
+multiplication falls back to shift-and-add and the inverse table keeps the old
+brute-force semantics (first x with a*x = 1, else 0).
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+AES_POLY = 0x11B
+
+
+def _normalize_poly(poly: int) -> int:
+    """Only the low byte of the modulus takes part in the reduction (x^8 is implied)."""
+    return 0x100 | (int(poly) & 0xFF)
+
+
+def _mul_bitwise(a: int, b: int, poly: int) -> int:
+    """Shift-and-add multiplication modulo `poly` (used to build the tables)."""
+    result = 0
+    a &= 0xFF
+    b &= 0xFF
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        carry = a & 0x80
+        a = (a << 1) & 0xFF
+        if carry:
+            a ^= (poly & 0xFF)
+    return result
+
+
+@lru_cache(maxsize=32)
+def get_tables(poly: int = AES_POLY) -> Tuple[Optional[List[int]], Optional[List[int]], List[int]]:
+    """
+    Returns (exp, log, inv) for GF(2^8) modulo `poly`.
+    exp has 510 entries so that exp[log[a] + log[b]] needs no modulo.
+    exp/log are None when `poly` is reducible (no generator of order 255).
+    """
+    poly = _normalize_poly(poly)
+
+    for g in range(2, 256):
+        exp = [0] * 510
+        log = [0] * 256
+        x = 1
+        for i in range(255):
+            if i > 0 and x == 1:
+                break  # Order of g is smaller than 255: not a generator
+            exp[i] = x
+            log[x] = i
+            x = _mul_bitwise(x, g, poly)
+        else:
+            if x != 1:
+                continue
+            for i in range(255, 510):
+                exp[i] = exp[i - 255]
+            inv = [0] * 256
+            for a in range(1, 256):
+                inv[a] = exp[255 - log[a]]
+            return exp, log, inv
+
+    return None, None, _inverse_table_bitwise(poly)
+
+
+def _inverse_table_bitwise(poly: int) -> List[int]:
+    """Inverse table for a reducible modulus: first x with a*x = 1 (0 if none)."""
+    inv = [0] * 256
+    for a in range(1, 256):
+        # Products a*x for all x: a*x = XOR of a*2^i over the set bits of x
+        basis = [a]
+        for _ in range(7):
+            basis.append(_mul_bitwise(basis[-1], 2, poly))
+        prod = [0] * 256
+        for x in range(1, 256):
+            low = x & -x
+            prod[x] = prod[x ^ low] ^ basis[low.bit_length() - 1]
+            if prod[x] == 1:
+                inv[a] = x
+                break
+    return inv
+
+
+def mul(a: int, b: int, poly: int = AES_POLY) -> int:
+    """Multiply two elements of GF(2^8) modulo `poly`."""
+    a &= 0xFF
+    b &= 0xFF
+    if a == 0 or b == 0:
+        return 0
+    exp, log, _ = get_tables(poly)
+    if exp is None:
+        return _mul_bitwise(a, b, _normalize_poly(poly))
+    return exp[log[a] + log[b]]
+
+
+def inverse(a: int, poly: int = AES_POLY) -> int:
+    """Multiplicative inverse in GF(2^8) modulo `poly` (0 maps to 0)."""
+    return get_tables(poly)[2][a & 0xFF]
+
+
+def inverse_table(poly: int = AES_POLY) -> List[int]:
+    """All 256 inverses modulo `poly` (index = element)."""
+    return list(get_tables(poly)[2])
+
+
+@lru_cache(maxsize=64)
+def mul_table(c: int, poly: int = AES_POLY) -> Tuple[int, ...]:
+    """256-entry table of c * x for every x (e.g. c = 0x02 is xtime)."""
+    return tuple(mul(c, x, poly) for x in range(256))
@@ -0,0 +1,108 @@
+"""
+S-Box Metric Cache
+------------------
+Content-addressed cache for S-Box analysis results.
+
+Entries are keyed by a SHA-256 fingerprint of the 256-byte S-Box, so the same
+box hits the cache no matter how it was submitted (preset name, custom string,
+Excel upload, comparison slot).
+
+Two tiers:
+- A bounded in-memory LRU (per process).
+- An optional SQLite file (stdlib sqlite3) that survives gunicorn worker
+  restarts. Enabled by setting the SBOX_CACHE_DB environment variable to a
+  file path.
+
+Values must be JSON-serializable (they are stored as JSON in SQLite).
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+def sbox_fingerprint(sbox) -> str:
+    """Hex SHA-256 of the S-Box as 256 raw bytes."""
+    return hashlib.sha256(bytes(int(x) for x in sbox)).hexdigest()
+
+
+class MetricCache:
+    """Bounded LRU with an optional SQLite tier behind it."""
+
+    def __init__(self, maxsize: int = 256, db_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        'CREATE TABLE IF NOT EXISTS metrics (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+                    )
+            except sqlite3.Error as e:
+                # Disk tier is best-effort: run memory-only rather than fail at import
+                print(f"Metric cache: SQLite file unavailable ({e}), using memory only")
+                self.db_path = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation: safe across threads and forked workers
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _remember(self, key: str, value: Any) -> None:
+        """Insert into the in-memory LRU (caller holds the lock)."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if not self.db_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value FROM metrics WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            return None  # Disk tier is best-effort
+        if row is None:
+            return None
+
+        value = json.loads(row[0])
+        with self._lock:
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO metrics (key, value) VALUES (?, ?)',
+                    (key, json.dumps(value))
+                )
+        except sqlite3.Error:
+            pass  # Disk tier is best-effort
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Cached value for `key`, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Drops the in-memory tier (the SQLite file is left alone)."""
+        with self._lock:
+            self._entries.clear()
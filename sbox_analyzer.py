@@ -1,4 +1,14 @@
+import multiprocessing
+import os
+import threading
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from multiprocessing import shared_memory
+
+import gf256
+from metric_cache import MetricCache, sbox_fingerprint
 
 # AES S-Box (Standard)
 AES_SBOX = [
@@ -104,6 +114,42 @@ def walsh_hadamard_transform(f):
         res.append(left[i] - right[i])
     return res
 
+# Hamming weight of every byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int32)
+
+def _fast_wht_rows(W):
+    """
+    In-place fast Walsh-Hadamard Transform of every row of W (shape (rows, 2^n)).
+    Same (natural) ordering as walsh_hadamard_transform.
+    """
+    rows, size = W.shape
+    h = 1
+    while h < size:
+        blocks = W.reshape(rows, size // (2 * h), 2, h)
+        u = blocks[:, :, 0, :].copy()
+        blocks[:, :, 0, :] += blocks[:, :, 1, :]
+        blocks[:, :, 1, :] = u - blocks[:, :, 1, :]
+        h *= 2
+    return W
+
+@lru_cache(maxsize=64)
+def _walsh_spectrum(sbox):
+    sbox_arr = np.array(sbox, dtype=np.int64)
+    masks = np.arange(256)
+    # Component functions f_b(x) = b.S(x) in +-1 form, one row per mask b
+    parity = _POPCOUNT[masks[:, None] & sbox_arr[None, :]] & 1
+    W = _fast_wht_rows((1 - 2 * parity).astype(np.int32))
+    W.setflags(write=False)
+    return W
+
+def get_walsh_spectrum(sbox):
+    """
+    Walsh spectrum of all 256 component functions of the S-Box, computed once per S-Box.
+    W[b][a] = sum_x (-1)^(b.S(x) + a.x)
+    Row b is the WHT of the component function f_b(x) = b.S(x) (row 1<<i is output bit i).
+    """
+    return _walsh_spectrum(tuple(int(x) for x in sbox))
+
 def calculate_nonlinearity(sbox):
     """
     Calculates the Nonlinearity of the S-Box.
@@ -111,25 +157,30 @@ def calculate_nonlinearity(sbox):
     NL(f) = 2^(n-1) - 1/2 * max(|WHT(f)|)
     """
     n = 8
-    min_nl = 256 # Start high
+    W = get_walsh_spectrum(sbox)
     
-    for bit in range(8):
-        # Construct boolean function for this bit
-        # Map 0 -> 1, 1 -> -1 (or vice versa, magnitude is what matters)
-        f = []
-        for x in range(256):
-            val = sbox[x]
-            bit_val = (val >> bit) & 1
-            f.append(1 if bit_val == 0 else -1)
-            
-        wht = walsh_hadamard_transform(f)
-        max_abs_wht = max(abs(x) for x in wht)
-        
-        nl = (2**(n-1)) - (max_abs_wht / 2)
-        if nl < min_nl:
-            min_nl = nl
-            
-    return int(min_nl)
+    # Single output bits f_i are the components with mask 1 << i
+    masks = [1 << bit for bit in range(n)]
+    max_abs_wht = np.abs(W[masks]).max(axis=1)
+    
+    nl = (2**(n-1)) - (max_abs_wht / 2)
+    return int(nl.min())
+
+def _avalanche_differences(sbox):
+    """Output differences S(x) ^ S(x ^ e_i): row i = flipped input bit, column x."""
+    sbox_arr = np.array([int(v) for v in sbox], dtype=np.int64)
+    x = np.arange(256)
+    flips = 1 << np.arange(8)
+    return sbox_arr[x[None, :] ^ flips[:, None]] ^ sbox_arr[None, :]
+
+def get_sac_matrix(sbox):
+    """
+    Full 8x8 SAC matrix.
+    M[i][j] = probability that output bit j changes when input bit i is flipped.
+    """
+    diffs = _avalanche_differences(sbox)
+    out_bits = (diffs[:, :, None] >> np.arange(8)) & 1  # [input bit, x, output bit]
+    return out_bits.mean(axis=1)
 
 def calculate_sac(sbox):
     """
@@ -138,27 +189,11 @@ def calculate_sac(sbox):
     Ideal value is 0.5.
     """
     n = 8
-    total_sac = 0
-    count = 0
+    diffs = _avalanche_differences(sbox)
     
-    # For each input bit position i (0..7)
-    for i in range(n):
-        # For each input x (0..255)
-        for x in range(256):
-            # Flip bit i of x
-            x_flipped = x ^ (1 << i)
-            
-            y1 = sbox[x]
-            y2 = sbox[x_flipped]
-            
-            diff = y1 ^ y2
-            
-            # Count how many bits changed in output
-            # Hamming weight of diff
-            hw = bin(diff).count('1')
-            
-            total_sac += hw
-            count += 8 # 8 output bits
+    # Hamming weight of every output difference (8 output bits each)
+    total_sac = int(_POPCOUNT[diffs].sum())
+    count = diffs.size * n
             
     return total_sac / count
 
@@ -168,27 +203,27 @@ def calculate_bic_nl(sbox):
     Min NL of XOR sum of any two output bits.
     """
     n = 8
-    min_nl = 256
+    W = get_walsh_spectrum(sbox)
     
-    for i in range(n):
-        for j in range(i + 1, n):
-            # Boolean function for f_i XOR f_j
-            f = []
-            for x in range(256):
-                val = sbox[x]
-                bit_i = (val >> i) & 1
-                bit_j = (val >> j) & 1
-                res_bit = bit_i ^ bit_j
-                f.append(1 if res_bit == 0 else -1)
-            
-            wht = walsh_hadamard_transform(f)
-            max_abs_wht = max(abs(x) for x in wht)
-            nl = (2**(n-1)) - (max_abs_wht / 2)
-            
-            if nl < min_nl:
-                min_nl = nl
-                
-    return int(min_nl)
+    # f_i XOR f_j is the component with mask (1 << i) | (1 << j)
+    masks = [(1 << i) | (1 << j) for i in range(n) for j in range(i + 1, n)]
+    max_abs_wht = np.abs(W[masks]).max(axis=1)
+    
+    nl = (2**(n-1)) - (max_abs_wht / 2)
+    return int(nl.min())
+
+def get_bic_sac_matrix(sbox):
+    """
+    Full 8x8 BIC-SAC matrix.
+    B[i][j] = probability that f_i XOR f_j changes when a single input bit is flipped
+    (averaged over all input bits). The diagonal is 0.
+    """
+    diffs = _avalanche_differences(sbox)
+    bits = 1 << np.arange(8)
+    pair_masks = bits[:, None] ^ bits[None, :]
+    # Bit i ^ bit j of the difference = parity of (diff & mask_ij)
+    changed = _POPCOUNT[diffs[:, :, None, None] & pair_masks] & 1
+    return changed.mean(axis=(0, 1))
 
 def calculate_bic_sac(sbox):
     """
@@ -197,39 +232,10 @@ def calculate_bic_sac(sbox):
     Simplified: Average SAC of f_i XOR f_j.
     """
     n = 8
-    total_sac_xor = 0
-    count_xor = 0
+    B = get_bic_sac_matrix(sbox)
     
-    for i in range(n):
-        for j in range(i + 1, n):
-            # Calculate SAC for function h = f_i ^ f_j
-            current_sac_sum = 0
-            current_count = 0
-            
-            for k in range(n): # Input bit to flip
-                for x in range(256):
-                    x_flipped = x ^ (1 << k)
-                    y1 = sbox[x]
-                    y2 = sbox[x_flipped]
-                    
-                    # Bits i and j of y1
-                    b1_i = (y1 >> i) & 1
-                    b1_j = (y1 >> j) & 1
-                    h1 = b1_i ^ b1_j
-                    
-                    # Bits i and j of y2
-                    b2_i = (y2 >> i) & 1
-                    b2_j = (y2 >> j) & 1
-                    h2 = b2_i ^ b2_j
-                    
-                    if h1 != h2:
-                        current_sac_sum += 1
-                    current_count += 1
-            
-            total_sac_xor += (current_sac_sum / current_count)
-            count_xor += 1
-            
-    return total_sac_xor / count_xor
+    # Average over the 28 output bit pairs (i < j)
+    return float(B[np.triu_indices(n, 1)].mean())
 
 def calculate_lap(sbox):
     """
@@ -267,28 +273,9 @@ def calculate_lap(sbox):
     # We need max_{a,b != 0} |LAT[a][b]|.
     # Iterate over all non-zero b.
     
-    max_abs_lat = 0
-    
-    for b in range(1, 256):
-        # Construct boolean function f_b(x) = b.S(x)
-        f = []
-        for x in range(256):
-            val = sbox[x]
-            # Dot product b.val over GF(2) is parity of (b & val)
-            dot_prod = bin(b & val).count('1') % 2
-            f.append(1 if dot_prod == 0 else -1)
-            
-        wht = walsh_hadamard_transform(f)
-        
-        # WHT values are 2 * LAT values.
-        # We ignore a=0 if b=0, but b starts at 1.
-        # For a given b, check all a.
-        # Note: if b!=0, WHT[0] corresponds to a=0 (linear bias of output combination).
-        # We check all a.
-        
-        current_max = max(abs(x) for x in wht)
-        if current_max > max_abs_lat:
-            max_abs_lat = current_max
+    # Row b of the Walsh spectrum is WHT(f_b), i.e. 2 * LAT[.][b] (b = 0 excluded).
+    W = get_walsh_spectrum(sbox)
+    max_abs_lat = int(np.abs(W[1:]).max())
             
     # max_abs_lat is 2 * max_bias * 256?
     # WHT = sum (-1)^(...)
@@ -332,29 +319,32 @@ def calculate_lap(sbox):
     
     return (max_abs_lat / 128.0) ** 2
 
+@lru_cache(maxsize=64)
+def _difference_distribution(sbox):
+    sbox_arr = np.array(sbox, dtype=np.int64)
+    x = np.arange(256)
+    # dy = S(x) ^ S(x ^ dx) for every (dx, x) pair: row dx, column x
+    dy = sbox_arr[x[:, None] ^ x[None, :]] ^ sbox_arr[None, :]
+    # Per-row bincount: offset each row into its own 256-bin range
+    D = np.bincount((dy + 256 * x[:, None]).ravel(), minlength=256 * 256).reshape(256, 256)
+    D.setflags(write=False)
+    return D
+
+def get_difference_distribution(sbox):
+    """
+    Full Differential Distribution Table as a 256x256 array, computed once per S-Box.
+    D[dx][dy] = #{x | S(x) ^ S(x^dx) = dy}
+    """
+    return _difference_distribution(tuple(int(x) for x in sbox))
+
 def calculate_dap(sbox):
     """
     Calculates Differential Approximation Probability (DAP).
     DAP = max_{dx, dy != 0} #{x | S(x) ^ S(x^dx) = dy} / 2^n
     """
-    n = 8
-    max_count = 0
-    
-    # Differential Distribution Table (DDT)
-    # 256 x 256 table
-    # Iterate dx from 1 to 255
-    for dx in range(1, 256):
-        counts = {}
-        for x in range(256):
-            y1 = sbox[x]
-            y2 = sbox[x ^ dx]
-            dy = y1 ^ y2
-            counts[dy] = counts.get(dy, 0) + 1
-            
-        # Find max count for this dx (ignoring dy=0 if any, but dy shouldn't be 0 for bijective sbox if dx!=0)
-        for dy, count in counts.items():
-            if count > max_count:
-                max_count = count
+    # Max over dx != 0 of the shared Differential Distribution Table (DDT)
+    D = get_difference_distribution(sbox)
+    max_count = int(D[1:].max())
                 
     return max_count / 256.0
 
@@ -395,6 +385,11 @@ def encrypt_image(image_bytes, sbox):
 
 # --- S-Box Construction Functions ---
 
+# AES affine constant 0x63 as a bit vector (LSB first)
+C_AES_BITS = [1, 1, 0, 0, 0, 1, 1, 0]
+
+_BIT_SHIFTS = np.arange(8, dtype=np.int32)
+
 def construct_sbox_from_matrix(affine_matrix: list, c_constant: list = None, mod_poly: int = 0x11B) -> np.ndarray:
     """
     Construct S-box from affine matrix using AES construction method.
@@ -407,55 +402,49 @@ def construct_sbox_from_matrix(affine_matrix: list, c_constant: list = None, mod
     Returns:
         256-element S-box as numpy array
     """
-    if c_constant is None:
-        c_constant = np.array([1, 1, 0, 0, 0, 1, 1, 0], dtype=np.uint8)
-    else:
-        c_constant = np.array(c_constant, dtype=np.uint8)
+    return construct_sboxes_from_matrices([affine_matrix], [c_constant], mod_poly)[0]
+
+def construct_sboxes_from_matrices(affine_matrices: list, c_constants: list = None, mod_poly: int = 0x11B) -> np.ndarray:
+    """
+    Construct M S-boxes at once from a stack of affine matrices.
     
-    K = np.array(affine_matrix, dtype=np.uint8)
+    The 256 inverses are unpacked to bits once and every S-box comes out of a
+    single (M,8,8) x (8,256) GF(2) product.
     
-    # Generate inverse table
-    inv_table = np.zeros(256, dtype=np.uint8)
-    for i in range(256):
-        inv_table[i] = _gf_inverse(i, mod_poly)
+    Args:
+        affine_matrices: M 8x8 matrices (list or array of shape (M,8,8))
+        c_constants: M 8-bit constant vectors; None (or a None entry) means C_AES
+        mod_poly: Irreducible polynomial for GF(2^8) (default: 0x11B)
     
-    # Construct S-box
-    sbox = np.zeros(256, dtype=np.uint8)
-    for x in range(256):
-        x_inv = int(inv_table[x])
-        x_inv_vec = _int_to_binary_vector(x_inv)
-        
-        # Affine transformation: B(x) = (K × x^-1 + C) mod 2
-        result_vec = (K @ x_inv_vec) % 2
-        result_vec = (result_vec + c_constant) % 2
-        
-        sbox[x] = _binary_vector_to_int(result_vec)
+    Returns:
+        (M, 256) uint8 array, one S-box per row
+    """
+    K = np.array(affine_matrices, dtype=np.int32).reshape(-1, 8, 8)
+    M = K.shape[0]
+    
+    if c_constants is None:
+        c_constants = [None] * M
+    if len(c_constants) != M:
+        raise ValueError("Need one constant vector per affine matrix")
+    C = np.array([C_AES_BITS if c is None else c for c in c_constants], dtype=np.int32).reshape(M, 8)
     
-    return sbox
+    # Inverse table (memoized per polynomial) unpacked to bit columns, LSB first: (8, 256)
+    inv_table = np.array(gf256.inverse_table(mod_poly), dtype=np.int32)
+    inv_bits = (inv_table[None, :] >> _BIT_SHIFTS[:, None]) & 1
+    
+    # Affine transformation: B(x) = (K × x^-1 + C) mod 2, for all M and all x
+    out_bits = (np.matmul(K, inv_bits) + C[:, :, None]) & 1
+    
+    # Pack bit rows back into bytes (LSB first)
+    return (out_bits << _BIT_SHIFTS[None, :, None]).sum(axis=1).astype(np.uint8)
 
 def _gf_inverse(a: int, mod_poly: int = 0x11B) -> int:
     """Compute multiplicative inverse in GF(2^8)."""
-    if a == 0:
-        return 0
-    for x in range(1, 256):
-        if _gf_multiply(a, x, mod_poly) == 1:
-            return x
-    return 0
+    return gf256.inverse(a, mod_poly)
 
 def _gf_multiply(a: int, b: int, mod_poly: int = 0x11B) -> int:
     """Multiply two elements in GF(2^8) with specified modulus."""
-    result = 0
-    aa = a & 0xFF
-    bb = b & 0xFF
-    while bb:
-        if bb & 1:
-            result ^= aa
-        bb >>= 1
-        carry = aa & 0x80
-        aa = (aa << 1) & 0xFF
-        if carry:
-            aa ^= (mod_poly & 0xFF)
-    return result & 0xFF
+    return gf256.mul(a, b, mod_poly)
 
 def _int_to_binary_vector(value: int) -> np.ndarray:
     """Convert integer to 8-bit binary vector (LSB first)."""
@@ -557,22 +546,8 @@ def calculate_differential_uniformity(sbox):
     Calculates Differential Uniformity (DU).
     DU = max_{dx != 0, dy} #{x | S(x) ^ S(x^dx) = dy}
     """
-    n = 8
-    max_count = 0
-    
-    for dx in range(1, 256):
-        counts = {}
-        for x in range(256):
-            y1 = sbox[x]
-            y2 = sbox[x ^ dx]
-            dy = y1 ^ y2
-            counts[dy] = counts.get(dy, 0) + 1
-            
-        for count in counts.values():
-            if count > max_count:
-                max_count = count
-                
-    return max_count
+    D = get_difference_distribution(sbox)
+    return int(D[1:].max())
 
 def calculate_algebraic_degree(sbox):
     """
@@ -615,7 +590,6 @@ def calculate_transparency_order(sbox):
     """
     n = 8
     M = 256
-    max_to = -float('inf')
     
     # Precompute Walsh Transforms for all linear combinations of output bits
     # WHT_b[a] = sum_{x} (-1)^(b.S(x) + a.x)
@@ -625,32 +599,16 @@ def calculate_transparency_order(sbox):
     
     # We need to sum |WHT_a[beta]| over all a != 0.
     
-    # Store sum of absolute Walsh values for each beta
-    sum_abs_wht_beta = [0.0] * 256
-    
-    for a in range(1, 256):
-        # Component function f_a(x) = a.S(x)
-        f = []
-        for x in range(256):
-            val = sbox[x]
-            dot_prod = bin(a & val).count('1') % 2
-            f.append(1 if dot_prod == 0 else -1)
-            
-        wht = walsh_hadamard_transform(f)
-        
-        for beta in range(1, 256):
-            sum_abs_wht_beta[beta] += abs(wht[beta])
+    # Sum of absolute Walsh values for each beta (column), over all components a != 0
+    W = get_walsh_spectrum(sbox)
+    sum_abs_wht_beta = np.abs(W[1:]).sum(axis=0)
             
     # Calculate TO for each beta
     factor = 1.0 / (M * (M - 1))
     
-    for beta in range(1, 256):
-        wt_beta = bin(beta).count('1')
-        term = n - 2 * wt_beta - factor * sum_abs_wht_beta[beta]
-        if term > max_to:
-            max_to = term
-            
-    return max_to
+    betas = np.arange(1, 256)
+    terms = n - 2 * _POPCOUNT[betas] - factor * sum_abs_wht_beta[betas]
+    return float(terms.max())
 
 def calculate_correlation_immunity(sbox):
     """
@@ -660,33 +618,16 @@ def calculate_correlation_immunity(sbox):
     """
     n = 8
     min_ci = 8
+    W = get_walsh_spectrum(sbox)
+    weights = _POPCOUNT[1:]
     
     for bit in range(8):
-        # Component function
-        f = []
-        for x in range(256):
-            val = sbox[x]
-            bit_val = (val >> bit) & 1
-            f.append(1 if bit_val == 0 else -1)
-            
-        wht = walsh_hadamard_transform(f)
+        wht = W[1 << bit, 1:]
         
-        # Check CI for this component
-        ci = 0
-        for k in range(1, n + 1):
-            is_zero = True
-            # Check all w with weight k
-            # This is inefficient to iterate all 256 indices and check weight every time.
-            # But 256 is small.
-            for w in range(1, 256):
-                if bin(w).count('1') == k:
-                    if wht[w] != 0:
-                        is_zero = False
-                        break
-            if is_zero:
-                ci = k
-            else:
-                break
+        # CI = k means WHT vanishes for all 1 <= wt(w) <= k,
+        # i.e. one less than the lowest weight with a non-zero coefficient.
+        nonzero_weights = weights[wht != 0]
+        ci = int(nonzero_weights.min()) - 1 if nonzero_weights.size else n
         
         if ci < min_ci:
             min_ci = ci
@@ -699,16 +640,7 @@ def get_ddt_table(sbox):
     DDT[dx][dy] = #{x | S(x) ^ S(x^dx) = dy}
     Returns a list of lists (2D array).
     """
-    ddt = [[0] * 256 for _ in range(256)]
-    
-    for dx in range(256):
-        for x in range(256):
-            y1 = sbox[x]
-            y2 = sbox[x ^ dx]
-            dy = y1 ^ y2
-            ddt[dx][dy] += 1
-            
-    return ddt
+    return get_difference_distribution(sbox).tolist()
 
 def get_lat_table(sbox):
     """
@@ -717,30 +649,302 @@ def get_lat_table(sbox):
     Returns a list of lists (2D array).
     Values are biased centered at 0 (range -128 to 128).
     """
-    lat = [[0] * 256 for _ in range(256)]
+    # WHT(f_b)[a] = sum (-1)^(b.S(x) + a.x) = 2 * LAT[a][b]
+    W = get_walsh_spectrum(sbox)
+    return (W.T // 2).tolist()
+
+# --- Cached Analysis ---
+
+# Part of every key: bump it whenever a metric or table formula changes, so
+# results persisted by an older version are not served again
+CACHE_VERSION = 1
+
+# Content-addressed results; set SBOX_CACHE_DB to a file path to persist them
+# across worker restarts. Tables are ~128K values each, so keep fewer of them.
+_METRICS_CACHE = MetricCache(maxsize=1024, db_path=os.environ.get('SBOX_CACHE_DB'))
+_TABLES_CACHE = MetricCache(maxsize=32, db_path=os.environ.get('SBOX_CACHE_DB'))
+
+def _compute_metrics(sbox):
+    balance_results = check_balance(sbox)
+    return {
+        'is_bijective': check_bijective(sbox),
+        'balance_results': balance_results,
+        'metrics': {
+            'nl': calculate_nonlinearity(sbox),
+            'sac': calculate_sac(sbox),
+            'bic_nl': calculate_bic_nl(sbox),
+            'bic_sac': calculate_bic_sac(sbox),
+            'lap': calculate_lap(sbox),
+            'dap': calculate_dap(sbox),
+            'du': calculate_differential_uniformity(sbox),
+            'ad': calculate_algebraic_degree(sbox),
+            'to': calculate_transparency_order(sbox),
+            'ci': calculate_correlation_immunity(sbox)
+        }
+    }
+
+def analyze_sbox(sbox):
+    """
+    Full analysis of an S-Box: bijectivity, balance and every scalar metric.
+    Cached by S-Box fingerprint, so repeat analyses are a dictionary lookup.
+    The returned dict is shared; do not modify it.
+    """
+    sbox = [int(x) for x in sbox]
+    return _METRICS_CACHE.get_or_compute(_metrics_key(sbox), lambda: _compute_metrics(sbox))
+
+def _metrics_key(sbox):
+    return f'metrics:v{CACHE_VERSION}:' + sbox_fingerprint(sbox)
+
+# Worker processes for analyze_sboxes and parallel image encryption,
+# created on first use and kept for the process lifetime. Workers are spawned,
+# not forked: a fork from a request thread could copy a lock (e.g. the cipher
+# cache's) held by another thread, and the worker would deadlock on it.
+# Spawned workers also share the parent's shared-memory resource tracker.
+_POOL_WORKERS = os.cpu_count() or 1
+_PROCESS_POOL = None
+_PROCESS_POOL_LOCK = threading.Lock()
+
+def _get_process_pool():
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(max_workers=_POOL_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _PROCESS_POOL
+
+def _reset_process_pool():
+    """Drops a broken pool (a worker died) so the next call starts a fresh one."""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        _PROCESS_POOL = None
+
+def analyze_sboxes(sboxes):
+    """
+    analyze_sbox for many S-Boxes, results in input order.
+    Cache hits are served directly; the distinct uncached boxes are spread over
+    a process pool sized to the machine's cores.
+    """
+    sboxes = [[int(x) for x in sbox] for sbox in sboxes]
+    keys = [_metrics_key(sbox) for sbox in sboxes]
+    results = [_METRICS_CACHE.get(key) for key in keys]
     
-    for b in range(256):
-        # Component function f_b(x) = b.S(x)
-        f = []
-        for x in range(256):
-            val = sbox[x]
-            # Dot product b.val over GF(2)
-            dot_prod = bin(b & val).count('1') % 2
-            f.append(1 if dot_prod == 0 else -1)
-            
-        wht = walsh_hadamard_transform(f)
-        
-        # WHT[a] = sum (-1)^(b.S(x) + a.x)
-        # LAT[a][b] = WHT[a] / 2
-        for a in range(256):
-            lat[a][b] = wht[a] // 2
-            
-    return lat
+    # Distinct boxes still to compute (duplicates in the batch are computed once)
+    pending = {}
+    for key, sbox, result in zip(keys, sboxes, results):
+        if result is None and key not in pending:
+            pending[key] = sbox
+    
+    if len(pending) > 1:
+        pool = _get_process_pool()
+        chunksize = max(1, len(pending) // (4 * _POOL_WORKERS))
+        try:
+            computed = list(pool.map(_compute_metrics, pending.values(), chunksize=chunksize))
+        except BrokenProcessPool:
+            _reset_process_pool()
+            raise
+    else:
+        computed = [_compute_metrics(sbox) for sbox in pending.values()]
+    
+    computed = dict(zip(pending, computed))
+    for key, analysis in computed.items():
+        _METRICS_CACHE.put(key, analysis)
+    
+    return [result if result is not None else computed[key] for key, result in zip(keys, results)]
 
+def get_analysis_tables(sbox):
+    """
+    DDT, LAT, SAC and BIC-SAC matrices as nested lists, cached like analyze_sbox.
+    The returned dict is shared; do not modify it.
+    """
+    sbox = [int(x) for x in sbox]
+    return _TABLES_CACHE.get_or_compute(f'tables:v{CACHE_VERSION}:' + sbox_fingerprint(sbox), lambda: {
+        'ddt': get_ddt_table(sbox),
+        'lat': get_lat_table(sbox),
+        'sac_matrix': get_sac_matrix(sbox).tolist(),
+        'bic_sac_matrix': get_bic_sac_matrix(sbox).tolist()
+    })
 
-def encrypt_image_data(image_bytes, sbox, key, mode='ecb', key_format='text'):
+# --- Parallel Image Encryption ---
+# Buffers at least this large are sharded over the process pool (smaller ones
+# finish faster than the round trip to the workers)
+PARALLEL_MIN_BYTES = 1 << 20
+PARALLEL_MODES = ('ecb', 'ctr')
+
+def _encrypt_shard(job):
+    """
+    Worker: encrypts bytes [start, stop) of a shared-memory buffer in place.
+    ECB shards are block aligned; CTR shards start at keystream block start // 16.
+    """
+    from aes_cipher import get_cipher # Local import to avoid circular dependency
+
+    shm_name, start, stop, key, sbox, mode, iv = job
+    shm = shared_memory.SharedMemory(name=shm_name)  # Owned (and unlinked) by the parent
+    try:
+        shard = np.ndarray((stop - start,), dtype=np.uint8, buffer=shm.buf, offset=start)
+        cipher = get_cipher(key, sbox)
+        if mode == 'ctr':
+            num_blocks = (len(shard) + 15) // 16
+            shard ^= cipher.ctr_keystream(iv, start // 16, num_blocks).reshape(-1)[:len(shard)]
+        else:
+            shard[:] = cipher.encrypt_blocks(shard.reshape(-1, 16)).reshape(-1)
+        del shard  # Release the view before closing the mapping
+    finally:
+        shm.close()
+    return stop - start
+
+def encrypt_parallel(data, key, sbox, mode='ecb', iv=None, workers=None):
+    """
+    Encrypts a large buffer across the process pool. Same output as
+    cipher.encrypt_data (ECB, PKCS7) or cipher.encrypt_ctr (CTR, no IV prefix).
+    The buffer lives in shared memory; every worker encrypts its own
+    block-aligned shard in place, so shards are never copied back and forth.
     """
-    Encrypts image bytes using either AES-ECB mode or Pure S-Box Substitution.
+    if mode not in PARALLEL_MODES:
+        raise ValueError(f'Parallel encryption supports: {", ".join(PARALLEL_MODES)}.')
+    if mode == 'ctr' and (iv is None or len(iv) != 16):
+        raise ValueError('CTR mode needs a 16-byte IV.')
+
+    size = len(data)
+    out_len = size if mode == 'ctr' else size - size % 16 + 16
+    if out_len == 0:
+        return b''
+    workers = workers or _POOL_WORKERS
+
+    shm = shared_memory.SharedMemory(create=True, size=out_len)
+    try:
+        buf = np.ndarray((out_len,), dtype=np.uint8, buffer=shm.buf)
+        buf[:size] = np.frombuffer(data, dtype=np.uint8)
+        if mode == 'ecb':
+            buf[size:] = out_len - size  # PKCS7
+
+        # One block-aligned shard per worker
+        shard_len = -(-out_len // (16 * workers)) * 16
+        jobs = [(shm.name, start, min(start + shard_len, out_len), bytes(key), list(sbox), mode, iv)
+                for start in range(0, out_len, shard_len)]
+        try:
+            list(_get_process_pool().map(_encrypt_shard, jobs))
+        except BrokenProcessPool:
+            _reset_process_pool()
+            raise
+
+        result = buf.tobytes()
+        del buf
+        return result
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _use_parallel(data):
+    return _POOL_WORKERS > 1 and len(data) >= PARALLEL_MIN_BYTES
+
+# --- Image Size Limits ---
+# Pixel budget (width * height) for image encryption/analysis.
+# The default is not an area budget but THUMBNAIL_BUDGET: the classic 128px
+# bounding box (longest side <= 128), so default results are unchanged. Area
+# budgets apply only when requested (max_pixels / full_resolution, up to 4K UHD).
+DEFAULT_MAX_DIM = 128
+THUMBNAIL_BUDGET = object()
+FULL_RESOLUTION_PIXEL_BUDGET = 3840 * 2160
+
+def fit_pixel_budget(img, max_pixels=THUMBNAIL_BUDGET):
+    """
+    Downscales a PIL image (keeping aspect ratio) so that width * height <= max_pixels.
+    THUMBNAIL_BUDGET fits it into DEFAULT_MAX_DIM x DEFAULT_MAX_DIM instead;
+    max_pixels=None keeps the image at full resolution.
+    """
+    if max_pixels is THUMBNAIL_BUDGET:
+        img.thumbnail((DEFAULT_MAX_DIM, DEFAULT_MAX_DIM))
+        return img
+    if max_pixels is None or img.width * img.height <= max_pixels:
+        return img
+    scale = (max_pixels / float(img.width * img.height)) ** 0.5
+    img.thumbnail((max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+    return img
+
+
+def _image_key(key, key_format='text'):
+    """Key for the image functions: text or hex string (or bytes), padded/truncated to 16/24/32 bytes."""
+    if isinstance(key, str):
+        try:
+            if key_format == 'hex':
+                key = bytes.fromhex(key)
+            else:
+                key = key.encode('utf-8')
+        except Exception as e:
+            print(f"Key Error: {e}")
+            key = key.encode('utf-8') # Fallback
+    
+    # Ensure key length (16, 24, 32)
+    if len(key) not in [16, 24, 32]:
+        if len(key) < 16: key += b'\0' * (16 - len(key))
+        elif len(key) < 24: key = key[:16]
+        elif len(key) < 32: key = key[:24]
+        else: key = key[:32]
+    return key
+
+def _channel_histograms(img_arr):
+    return {
+        'r': [int(x) for x in np.histogram(img_arr[:,:,0], bins=256, range=(0,256))[0]],
+        'g': [int(x) for x in np.histogram(img_arr[:,:,1], bins=256, range=(0,256))[0]],
+        'b': [int(x) for x in np.histogram(img_arr[:,:,2], bins=256, range=(0,256))[0]]
+    }
+
+def _encrypt_pixel_bytes(img_bytes, sbox, key, mode='ecb', iv=None):
+    """Full AES ciphertext of raw pixel bytes, without the IV (CBC/CTR need `iv`)."""
+    from aes_cipher import get_cipher # Local import to avoid circular dependency
+    
+    # Encrypt using robust AESCipher
+    cipher = get_cipher(key, sbox)
+    
+    if mode == 'cbc':
+        # CBC: PKCS7 padding, serial chain
+        pad_len = 16 - (len(img_bytes) % 16)
+        return cipher.encrypt_cbc(img_bytes + bytes([pad_len] * pad_len), iv)
+    
+    if mode == 'ctr':
+        # CTR Mode: vectorized keystream, no padding
+        if _use_parallel(img_bytes):
+            return encrypt_parallel(img_bytes, key, sbox, 'ctr', iv)
+        return cipher.encrypt_ctr(img_bytes, iv)
+    
+    # AES-ECB Mode (Default); large images are sharded over all cores
+    if _use_parallel(img_bytes):
+        return encrypt_parallel(img_bytes, key, sbox, 'ecb')
+    return cipher.encrypt_data(img_bytes)
+
+def _ciphertext_image(ciphertext, iv, shape):
+    """
+    The encrypted image as shown: IV (CBC/CTR) + ciphertext, cut to the pixel
+    count (the padding tail is dropped). Returns a uint8 array of `shape`.
+    """
+    data = ciphertext if iv is None else bytes(iv) + ciphertext
+    return np.frombuffer(data, dtype=np.uint8, count=int(np.prod(shape))).reshape(shape)
+
+def encrypt_image_array(pixels, sbox, key, mode='ecb', key_format='text', iv=None):
+    """
+    Encrypts an (H, W, 3) uint8 pixel array using AES (mode 'ecb', 'cbc' or 'ctr')
+    or Pure S-Box Substitution. No image decoding/encoding.
+    CBC/CTR use a random IV unless `iv` is given; the IV is prepended like in
+    encrypt_image_data. Returns the encrypted image as an (H, W, 3) uint8 array.
+    """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    
+    if mode == 'substitution':
+        # Pure S-Box Substitution (No AES Diffusion)
+        # This visualizes the S-Box bijectivity/nonlinearity directly on the image
+        return np.array(sbox, dtype=np.uint8)[pixels]
+    
+    if mode in ('cbc', 'ctr') and iv is None:
+        iv = os.urandom(16)
+    elif mode not in ('cbc', 'ctr'):
+        iv = None
+    ciphertext = _encrypt_pixel_bytes(pixels.tobytes(), sbox, _image_key(key, key_format), mode, iv)
+    return _ciphertext_image(ciphertext, iv, pixels.shape)
+
+def encrypt_image_data(image_bytes, sbox, key, mode='ecb', key_format='text', max_pixels=THUMBNAIL_BUDGET):
+    """
+    Encrypts image bytes using AES (mode 'ecb', 'cbc' or 'ctr') or Pure S-Box Substitution.
+    The image is downscaled to fit `max_pixels` (None = full resolution).
     Returns: 
     - encrypted_b64 (string)
     - histogram_original (dict: {'r': [], 'g': [], 'b': []})
@@ -749,121 +953,25 @@ def encrypt_image_data(image_bytes, sbox, key, mode='ecb', key_format='text'):
     try:
         from PIL import Image
         import io
-        import numpy as np
-        from aes_cipher import AESCipher # Local import to avoid circular dependency
         import base64
         
         # Load image
         img = Image.open(io.BytesIO(image_bytes))
         img = img.convert('RGB') # Ensure RGB
         
-        # Optimize: Resize image if too large (Pure Python AES is slow)
-        # Reduced to 128px for faster deployment processing
-        max_dim = 128
-        if img.width > max_dim or img.height > max_dim:
-            img.thumbnail((max_dim, max_dim))
-            
-        width, height = img.size
+        # Resize to the requested pixel budget (ECB runs on the vectorized batch engine)
+        img = fit_pixel_budget(img, max_pixels)
         
         # Convert to numpy array for histogram calculation
         img_arr = np.array(img)
+        hist_orig = _channel_histograms(img_arr)
         
-        # Calculate Original Histogram
-        hist_orig = {
-            'r': [int(x) for x in np.histogram(img_arr[:,:,0], bins=256, range=(0,256))[0]],
-            'g': [int(x) for x in np.histogram(img_arr[:,:,1], bins=256, range=(0,256))[0]],
-            'b': [int(x) for x in np.histogram(img_arr[:,:,2], bins=256, range=(0,256))[0]]
-        }
-        
-        encrypted_bytes_raw = None
-        
-        if mode == 'substitution':
-            # Pure S-Box Substitution (No AES Diffusion)
-            # This visualizes the S-Box bijectivity/nonlinearity directly on the image
-            sbox_arr = np.array(sbox, dtype=np.uint8)
-            pixels = np.array(img)
-            encrypted_pixels = sbox_arr[pixels]
-            img_enc = Image.fromarray(encrypted_pixels)
-            
-        else:
-            # AES-ECB Mode (Default)
-            img_bytes = img.tobytes()
-            original_len = len(img_bytes)
-            
-            # Sanitize Key based on Format
-            if isinstance(key, str):
-                try:
-                    if key_format == 'hex':
-                        key = bytes.fromhex(key)
-                    else:
-                        key = key.encode('utf-8')
-                except Exception as e:
-                    print(f"Key Error: {e}")
-                    key = key.encode('utf-8') # Fallback
-            
-            # Ensure key length (16, 24, 32)
-            if len(key) not in [16, 24, 32]:
-                if len(key) < 16: key += b'\0' * (16 - len(key))
-                elif len(key) < 24: key = key[:16]
-                elif len(key) < 32: key = key[:24]
-                else: key = key[:32]
-
-            # Encrypt using robust AESCipher
-            cipher = AESCipher(key, sbox)
-            
-            if mode == 'cbc':
-                # Manual CBC Implementation
-                # 1. Generate IV
-                import os
-                iv = os.urandom(16)
-                
-                # 2. Pad Data
-                pad_len = 16 - (len(img_bytes) % 16)
-                padded_data = img_bytes + bytes([pad_len] * pad_len)
-                
-                # 3. Encrypt Chain
-                encrypted_data = bytearray()
-                prev_block = list(iv)
-                
-                for i in range(0, len(padded_data), 16):
-                    block = list(padded_data[i:i+16])
-                    # XOR with prev_block
-                    xored_block = [b ^ p for b, p in zip(block, prev_block)]
-                    # Encrypt
-                    enc_block = cipher.encrypt_block(xored_block)
-                    encrypted_data.extend(enc_block)
-                    prev_block = enc_block
-                    
-                # Prepend IV to result
-                encrypted_bytes_padded = iv + bytes(encrypted_data)
-                
-            else:
-                # AES-ECB Mode (Default)
-                encrypted_bytes_padded = cipher.encrypt_data(img_bytes)
-            
-            # Truncate to original size for display purposes (Just for visualization length match)
-            # ERROR: If we truncate, we lose data. But for 'encrypted_bytes_raw' intended for NPCR,
-            # we should return the FULL ciphertext.
-            # However, for Image.frombytes visualization, length must match width*height*3.
-            # So we slice for visualization, but return full for analysis.
-            encrypted_bytes_raw = bytes(encrypted_bytes_padded)
-            visualization_bytes = encrypted_bytes_raw[:original_len]
-            
-            # Create Encrypted Image
-            img_enc = Image.frombytes('RGB', (width, height), visualization_bytes)
-            
-        
-        # Calculate Encrypted Histogram
-        img_enc_arr = np.array(img_enc)
-        hist_enc = {
-            'r': [int(x) for x in np.histogram(img_enc_arr[:,:,0], bins=256, range=(0,256))[0]],
-            'g': [int(x) for x in np.histogram(img_enc_arr[:,:,1], bins=256, range=(0,256))[0]],
-            'b': [int(x) for x in np.histogram(img_enc_arr[:,:,2], bins=256, range=(0,256))[0]]
-        }
+        img_enc_arr = encrypt_image_array(img_arr, sbox, key, mode, key_format)
+        hist_enc = _channel_histograms(img_enc_arr)
         
         # Convert encrypted image to base64
         buf = io.BytesIO()
-        img_enc.save(buf, format='PNG')
+        Image.fromarray(img_enc_arr).save(buf, format='PNG')
         encrypted_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
         
         return encrypted_b64, hist_orig, hist_enc, buf.getvalue()
@@ -881,13 +989,13 @@ def encrypt_image_data(image_bytes, sbox, key, mode='ecb', key_format='text'):
 
 def decrypt_image_data(encrypted_image_bytes, sbox, key, mode='ecb', key_format='text'):
     """
-    Decrypts image bytes using either AES-ECB mode or Pure S-Box Substituion (Inverse).
+    Decrypts image bytes using AES (mode 'ecb', 'cbc' or 'ctr') or Pure S-Box Substituion (Inverse).
     """
     try:
         from PIL import Image
         import io
         import numpy as np
-        from aes_cipher import AESCipher # Local import
+        from aes_cipher import get_cipher # Local import
         import base64
 
         img_enc = Image.open(io.BytesIO(encrypted_image_bytes))
@@ -908,23 +1016,7 @@ def decrypt_image_data(encrypted_image_bytes, sbox, key, mode='ecb', key_format=
             # Real AES needs original padded stream.
             img_bytes = img_enc.tobytes()
             
-            # Sanitize Key based on Format
-            if isinstance(key, str):
-                try:
-                    if key_format == 'hex':
-                        key = bytes.fromhex(key)
-                    else:
-                        key = key.encode('utf-8')
-                except:
-                    key = key.encode('utf-8')
-            
-            if len(key) not in [16, 24, 32]:
-                 if len(key) < 16: key += b'\0' * (16 - len(key))
-                 elif len(key) < 24: key = key[:16]
-                 elif len(key) < 32: key = key[:24]
-                 else: key = key[:32]
-
-            cipher = AESCipher(key, sbox)
+            cipher = get_cipher(_image_key(key, key_format), sbox)
             
             if mode == 'cbc':
                 # Manual CBC Decryption
@@ -937,27 +1029,23 @@ def decrypt_image_data(encrypted_image_bytes, sbox, key, mode='ecb', key_format=
                 if len(img_bytes) < 16:
                      decrypted_bytes_padded = b''
                 else:
-                    iv = list(img_bytes[:16])
-                    ciphertext = img_bytes[16:]
+                    # A truncated last block can't be decrypted; stop at the last whole block
+                    ciphertext = memoryview(img_bytes)[16:]
+                    whole_len = len(ciphertext) - (len(ciphertext) % 16)
                     
-                    decrypted_data = bytearray()
-                    prev_block = iv
-                    
-                    for i in range(0, len(ciphertext), 16):
-                        block = list(ciphertext[i:i+16])
-                        # If block is incomplete (truncation), we skip it or pad it?
-                        # Truncated last block implies we can't decrypt it securely.
-                        if len(block) < 16: break 
-                        
-                        dec_block = cipher.decrypt_block(block)
-                        xored_block = [d ^ p for d, p in zip(dec_block, prev_block)]
-                        decrypted_data.extend(xored_block)
-                        prev_block = block
-                    
-                    decrypted_bytes_padded = bytes(decrypted_data)
+                    # Batch decrypt + vectorized chaining XOR
+                    decrypted_bytes_padded = cipher.decrypt_cbc(ciphertext[:whole_len], img_bytes[:16])
+            elif mode == 'ctr':
+                # IV is the first 16 bytes; every visible byte after it decrypts (random access)
+                if len(img_bytes) < 16:
+                     decrypted_bytes_padded = b''
+                else:
+                    decrypted_bytes_padded = cipher.decrypt_ctr(memoryview(img_bytes)[16:], img_bytes[:16])
             else:
                 # AES-ECB Mode (Default)
-                decrypted_bytes_padded = cipher.decrypt_data(img_bytes)
+                # Visible pixels may end mid-block (tail was truncated on encryption)
+                whole_len = len(img_bytes) - (len(img_bytes) % 16)
+                decrypted_bytes_padded = cipher.decrypt_data(img_bytes[:whole_len])
             
             # Create Decrypted Image (Truncate to expected size)
             target_len = width * height * 3
@@ -977,6 +1065,99 @@ def decrypt_image_data(encrypted_image_bytes, sbox, key, mode='ecb', key_format=
         print(f"Error in decrypt_image_data: {e}")
         return None
 
+def calculate_entropy_array(img_array):
+    """
+    Shannon Entropy of an image given as a NumPy array ((H, W, 3) RGB or (H, W) grayscale).
+    RGB is converted to grayscale first, like calculate_entropy.
+    """
+    from PIL import Image
+
+    img_array = np.asarray(img_array, dtype=np.uint8)
+    if img_array.ndim == 3:
+        # Same luma conversion as PIL's convert('L'); no codec pass
+        img_array = np.array(Image.fromarray(img_array).convert('L'))
+    
+    # Optimized entropy calculation
+    hist = np.bincount(img_array.ravel(), minlength=256)
+    prob = hist / hist.sum()
+    prob = prob[prob > 0]  # Remove zeros to avoid log(0)
+    return float(-np.sum(prob * np.log2(prob)))
+
+# Adjacent-pixel offsets (dy, dx) for correlation analysis
+CORRELATION_DIRECTIONS = {'horizontal': (0, 1), 'vertical': (1, 0), 'diagonal': (1, 1)}
+CORRELATION_SCATTER_POINTS = 1000
+
+def _pearson(a, b):
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    a -= a.mean()
+    b -= b.mean()
+    denom = np.sqrt((a * a).sum() * (b * b).sum())
+    return float((a * b).sum() / denom) if denom else 0.0  # Flat channel: no correlation
+
+def calculate_correlation_array(img_array, sample_size=None, scatter_points=CORRELATION_SCATTER_POINTS, seed=None):
+    """
+    Adjacent-pixel correlation coefficients (horizontal, vertical, diagonal) per
+    channel of an (H, W, 3) RGB or (H, W) grayscale array.
+    All adjacent pairs are used (shifted array views), or `sample_size` random
+    pairs per direction for very large images.
+    Returns {'coefficients': {channel: {direction: r}}, 'scatter': {channel: {direction: {'x': [...], 'y': [...]}}}},
+    the scatter holding at most `scatter_points` pairs for plotting.
+    """
+    if sample_size is not None and sample_size <= 0:
+        raise ValueError('Sample size must be positive.')
+    img_array = np.asarray(img_array, dtype=np.uint8)
+    channels = {'gray': img_array} if img_array.ndim == 2 else {
+        name: img_array[:, :, i] for i, name in enumerate('rgb'[:img_array.shape[2]])
+    }
+    rng = np.random.default_rng(seed)
+    
+    coefficients, scatter = {}, {}
+    for name, channel in channels.items():
+        h, w = channel.shape
+        coefficients[name], scatter[name] = {}, {}
+        for direction, (dy, dx) in CORRELATION_DIRECTIONS.items():
+            if h <= dy or w <= dx:
+                coefficients[name][direction] = 0.0
+                scatter[name][direction] = {'x': [], 'y': []}
+                continue
+            
+            # Pixel and its neighbour as two shifted views (no copies)
+            first, second = channel[:h - dy, :w - dx], channel[dy:, dx:]
+            if sample_size is not None and sample_size < first.size:
+                rows = rng.integers(0, h - dy, sample_size)
+                cols = rng.integers(0, w - dx, sample_size)
+                first, second = first[rows, cols], second[rows, cols]
+            first, second = first.ravel(), second.ravel()
+            coefficients[name][direction] = _pearson(first, second)
+            
+            # Random subset of the pairs for the scatter plot
+            if first.size > scatter_points:
+                picks = rng.choice(first.size, scatter_points, replace=False)
+                first, second = first[picks], second[picks]
+            scatter[name][direction] = {'x': first.tolist(), 'y': second.tolist()}
+    
+    return {'coefficients': coefficients, 'scatter': scatter}
+
+def calculate_npcr_array(arr1, arr2):
+    """NPCR (%) of two equally shaped pixel arrays; 0 if the shapes differ."""
+    arr1, arr2 = np.asarray(arr1), np.asarray(arr2)
+    if arr1.shape != arr2.shape:
+        return 0
+    return float(np.count_nonzero(arr1 != arr2) / arr1.size * 100)
+
+def calculate_uaci_array(arr1, arr2):
+    """UACI (%) of two equally shaped uint8 pixel arrays; 0 if the shapes differ."""
+    arr1, arr2 = np.asarray(arr1, dtype=np.int16), np.asarray(arr2, dtype=np.int16)
+    if arr1.shape != arr2.shape:
+        return 0
+    return float(np.abs(arr1 - arr2).sum() / (255 * arr1.size) * 100)
+
+def _decode_rgb(image_bytes):
+    from PIL import Image
+    import io
+    return np.array(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+
 def calculate_entropy(image_bytes):
     """
     Calculates Shannon Entropy of an image.
@@ -986,48 +1167,33 @@ def calculate_entropy(image_bytes):
     try:
         from PIL import Image
         import io
-        import numpy as np
 
         img = Image.open(io.BytesIO(image_bytes))
         # Usually for image encryption papers, calculate on grayscale.
-        gray_img = img.convert('L')
-        img_array = np.array(gray_img)
-        
-        # Optimized entropy calculation
-        hist = np.histogram(img_array.flatten(), bins=256, range=(0, 256))[0]
-        prob = hist / hist.sum()
-        prob = prob[prob > 0]  # Remove zeros to avoid log(0)
-        entropy = -np.sum(prob * np.log2(prob))
-                
-        return float(entropy)
+        return calculate_entropy_array(np.array(img.convert('L')))
 
     except Exception as e:
         print(f"Error calculating entropy: {e}")
         return 0
 
+def calculate_correlation(image_bytes, sample_size=None, scatter_points=CORRELATION_SCATTER_POINTS, seed=None):
+    """
+    Adjacent-pixel correlation (horizontal, vertical, diagonal) per RGB channel.
+    Ideal: close to 1 for natural images, close to 0 for ciphertext.
+    """
+    try:
+        return calculate_correlation_array(_decode_rgb(image_bytes), sample_size, scatter_points, seed)
+
+    except Exception as e:
+        print(f"Error calculating correlation: {e}")
+        return {'coefficients': {}, 'scatter': {}}
+
 def calculate_npcr(image1_bytes, image2_bytes):
     """
     Calculates Number of Pixels Change Rate (NPCR).
     """
     try:
-        from PIL import Image
-        import io
-        import numpy as np
-
-        img1 = Image.open(io.BytesIO(image1_bytes)).convert('RGB')
-        img2 = Image.open(io.BytesIO(image2_bytes)).convert('RGB')
-        
-        if img1.size != img2.size:
-            return 0
-            
-        arr1 = np.array(img1, dtype=np.int32)
-        arr2 = np.array(img2, dtype=np.int32)
-        
-        # Optimized calculation
-        diff = arr1 != arr2
-        npcr = np.sum(diff) / diff.size * 100
-        
-        return float(npcr)
+        return calculate_npcr_array(_decode_rgb(image1_bytes), _decode_rgb(image2_bytes))
         
     except Exception as e:
         print(f"Error calculating NPCR: {e}")
@@ -1040,25 +1206,313 @@ def calculate_uaci(image1_bytes, image2_bytes):
     Ideal value approx 33.46%
     """
     try:
-        from PIL import Image
-        import io
-        import numpy as np
-
-        img1 = Image.open(io.BytesIO(image1_bytes)).convert('RGB')
-        img2 = Image.open(io.BytesIO(image2_bytes)).convert('RGB')
-        
-        if img1.size != img2.size:
-            return 0
-            
-        arr1 = np.array(img1, dtype=np.int32)
-        arr2 = np.array(img2, dtype=np.int32)
-        
-        # Optimized calculation
-        uaci = np.sum(np.abs(arr1 - arr2)) / (255 * arr1.size) * 100
-        
-        return float(uaci)
+        return calculate_uaci_array(_decode_rgb(image1_bytes), _decode_rgb(image2_bytes))
 
     except Exception as e:
         print(f"Error calculating UACI: {e}")
         return 0
 
+class ImagePipeline:
+    """
+    Decodes an uploaded image once (RGB, fitted to the pixel budget) and runs
+    every analysis stage on the pixel arrays: encryption, modified-plaintext
+    encryption, entropy, NPCR, UACI. Nothing is PNG-encoded or decoded again;
+    use to_png() only for images that go into the response.
+
+    CBC/CTR use one random IV for the whole pipeline, so encryptions of modified
+    pixels differ from the original's only because of the modification.
+    """
+
+    def __init__(self, image_bytes, sbox, key, mode='ecb', key_format='text', max_pixels=THUMBNAIL_BUDGET):
+        from PIL import Image
+        import io
+
+        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        self.pixels = np.ascontiguousarray(fit_pixel_budget(img, max_pixels))
+        self.sbox = [int(x) for x in sbox]
+        self.key = _image_key(key, key_format)
+        self.mode = mode
+        self.iv = os.urandom(16) if mode in ('cbc', 'ctr') else None
+        self._ciphertext = None
+        self._encrypted = None
+
+    @property
+    def ciphertext(self):
+        """Full AES ciphertext of the original pixels (no IV), computed once."""
+        if self._ciphertext is None:
+            self._ciphertext = _encrypt_pixel_bytes(self.pixels.tobytes(), self.sbox, self.key, self.mode, self.iv)
+        return self._ciphertext
+
+    @property
+    def encrypted(self):
+        """Encryption of the original pixels as an image array (computed once)."""
+        if self._encrypted is None:
+            if self.mode == 'substitution':
+                self._encrypted = encrypt_image_array(self.pixels, self.sbox, self.key, self.mode)
+            else:
+                self._encrypted = _ciphertext_image(self.ciphertext, self.iv, self.pixels.shape)
+        return self._encrypted
+
+    def encrypt(self, pixels):
+        """
+        Encrypts a modified copy of the pixels (same shape). Reuses the original
+        ciphertext and recomputes only the blocks the change reaches (AESCipher.reencrypt).
+        """
+        if self.mode == 'substitution':
+            return encrypt_image_array(pixels, self.sbox, self.key, self.mode)
+
+        from aes_cipher import get_cipher # Local import to avoid circular dependency
+
+        ciphertext = get_cipher(self.key, self.sbox).reencrypt(
+            self.ciphertext, self.pixels.reshape(-1), np.ascontiguousarray(pixels).reshape(-1), self.mode, self.iv
+        )
+        return _ciphertext_image(ciphertext, self.iv, self.pixels.shape)
+
+    def flip_bit(self, y=0, x=0, channel=0, bit=0):
+        """Copy of the pixels with one bit of one channel value flipped."""
+        modified = self.pixels.copy()
+        modified[y, x, channel] ^= 1 << bit
+        return modified
+
+    def sensitivity(self, y=0, x=0, channel=0, bit=0):
+        """NPCR and UACI between the encryptions of the original and a one-bit-modified image."""
+        modified = self.encrypt(self.flip_bit(y, x, channel, bit))
+        return calculate_npcr_array(self.encrypted, modified), calculate_uaci_array(self.encrypted, modified)
+
+    def sensitivity_sweep(self, positions):
+        """
+        NPCR and UACI for many single-bit flips at once. `positions` is a list of
+        (y, x, channel, bit). Each flip is compared against the shared original
+        encryption; only the ciphertext the flip reaches is recomputed (_sweep_flips).
+        Returns two float arrays (NPCR %, UACI %) in the order of `positions`.
+        """
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 4)
+        h, w, c = self.pixels.shape
+        y, x, channel, bit = positions.T
+        if ((y < 0) | (y >= h) | (x < 0) | (x >= w) | (channel < 0) | (channel >= c) | (bit < 0) | (bit > 7)).any():
+            raise ValueError('Flip position outside the image.')
+        flips = np.stack([(y * w + x) * c + channel, 1 << bit], axis=1)
+        size = self.pixels.size
+
+        if self.mode == 'substitution':
+            # One changed byte per flip: sbox[p ^ mask] vs sbox[p]
+            sbox_arr = np.array(self.sbox, dtype=np.int32)
+            plain = self.pixels.reshape(-1)[flips[:, 0]]
+            counts = np.ones(len(flips))
+            sums = np.abs(sbox_arr[plain ^ flips[:, 1]] - sbox_arr[plain])
+        else:
+            chunks = np.array_split(flips, min(_POOL_WORKERS, len(flips))) if len(flips) else []
+            if len(chunks) > 1:
+                results = _sweep_parallel(self.key, self.sbox, self.mode, self.iv, self.pixels.reshape(-1),
+                                          self.ciphertext, chunks)
+            else:
+                from aes_cipher import get_cipher # Local import to avoid circular dependency
+
+                cipher = get_cipher(self.key, self.sbox)
+                orig = np.frombuffer(self.ciphertext, dtype=np.uint8)
+                results = [_sweep_flips(cipher, self.mode, self.iv, self.pixels.reshape(-1), orig, chunk)
+                           for chunk in chunks]
+            counts = np.concatenate([r[0] for r in results]) if results else np.zeros(0)
+            sums = np.concatenate([r[1] for r in results]) if results else np.zeros(0)
+
+        return counts / size * 100, sums / (255 * size) * 100
+
+    @staticmethod
+    def to_png(img_array):
+        from PIL import Image
+        import io
+
+        buf = io.BytesIO()
+        Image.fromarray(img_array).save(buf, format='PNG')
+        return buf.getvalue()
+
+# --- NPCR / UACI Sweep ---
+# CBC flips per worker from which stepping all chains together (one batch per
+# block) beats re-encrypting each suffix on the serial path
+SWEEP_LOCKSTEP_MIN = 12
+
+def random_flip_positions(shape, count, seed=None):
+    """`count` random (y, x, channel, bit) flip positions for an (H, W, C) image."""
+    rng = np.random.default_rng(seed)
+    h, w, c = shape
+    return np.stack([rng.integers(0, h, count), rng.integers(0, w, count),
+                     rng.integers(0, c, count), rng.integers(0, 8, count)], axis=1)
+
+def _padded_plain(plain, idx):
+    """Bytes `idx` of the PKCS7-padded plaintext, read without padding (copying) the whole buffer."""
+    pad_len = 16 - len(plain) % 16
+    return np.where(idx < len(plain), plain[np.minimum(idx, len(plain) - 1)], pad_len).astype(np.uint8)
+
+def _sweep_flips(cipher, mode, iv, plain, orig, flips):
+    """
+    NPCR/UACI sums for ImagePipeline.sensitivity_sweep. `flips` is a (k, 2) array
+    of (byte index, xor mask) into the pixel bytes `plain`; `orig` is their
+    ciphertext. Returns per flip the number of changed bytes and the sum of
+    absolute differences over the visible image. Only what a flip reaches is
+    computed: its own block (ECB), its own byte (CTR), the suffix from its block (CBC).
+    """
+    limit = max(len(plain) - (16 if iv is not None else 0), 0)  # Ciphertext bytes visible in the image (IV first)
+    index, mask = flips[:, 0], flips[:, 1]
+
+    if mode == 'ctr':
+        # The flip XORs straight through to its ciphertext byte
+        visible = index < limit
+        a = orig[np.minimum(index, len(orig) - 1)].astype(np.int16)
+        return visible.astype(np.float64), np.where(visible, np.abs((a ^ mask) - a), 0).astype(np.float64)
+
+    if mode == 'ecb':
+        # One block per flip, all flips in one batch
+        idx = 16 * (index // 16)[:, None] + np.arange(16)
+        blocks = _padded_plain(plain, idx)
+        blocks[np.arange(len(flips)), index % 16] ^= mask.astype(np.uint8)
+        diff = np.abs(cipher.encrypt_blocks(blocks).astype(np.int16) - orig[idx]) * (idx < limit)
+        return np.count_nonzero(diff, axis=1).astype(np.float64), diff.sum(axis=1).astype(np.float64)
+
+    if len(flips) >= SWEEP_LOCKSTEP_MIN:
+        return _sweep_cbc_lockstep(cipher, iv, plain, orig, limit, flips)
+
+    # CBC: re-encrypt each suffix up to the last visible block
+    last_block = -(-limit // 16)
+    counts = np.zeros(len(flips))
+    sums = np.zeros(len(flips))
+    for i, (index, mask) in enumerate(flips):
+        first = index // 16
+        if first >= last_block:
+            continue
+        tail = _padded_plain(plain, np.arange(16 * first, 16 * last_block))
+        tail[index - 16 * first] ^= mask
+        prev = bytes(iv) if first == 0 else orig[16 * (first - 1):16 * first].tobytes()
+        changed = np.frombuffer(cipher.encrypt_cbc(tail, prev), dtype=np.uint8)
+
+        a, b = orig[16 * first:limit].astype(np.int16), changed[:limit - 16 * first].astype(np.int16)
+        counts[i] = np.count_nonzero(a != b)
+        sums[i] = np.abs(a - b).sum()
+    return counts, sums
+
+def _sweep_chunk(job):
+    """
+    Worker: _sweep_flips for one chunk of flips. Plaintext and ciphertext are
+    read from the parent's shared-memory segment (plaintext first).
+    """
+    from aes_cipher import get_cipher # Local import to avoid circular dependency
+
+    shm_name, plain_len, cipher_len, key, sbox, mode, iv, flips = job
+    shm = shared_memory.SharedMemory(name=shm_name)  # Owned (and unlinked) by the parent
+    try:
+        plain = np.ndarray((plain_len,), dtype=np.uint8, buffer=shm.buf)
+        orig = np.ndarray((cipher_len,), dtype=np.uint8, buffer=shm.buf, offset=plain_len)
+        result = _sweep_flips(get_cipher(key, sbox), mode, iv, plain, orig, flips)
+        del plain, orig  # Release the views before closing the mapping
+    finally:
+        shm.close()
+    return result
+
+def _sweep_parallel(key, sbox, mode, iv, plain, ciphertext, chunks):
+    """
+    Runs the flip chunks over the process pool. Plaintext and ciphertext are put
+    in one shared-memory segment, so the workers get only its name, not the buffers.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=len(plain) + len(ciphertext))
+    try:
+        buf = np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)
+        buf[:len(plain)] = plain
+        buf[len(plain):len(plain) + len(ciphertext)] = np.frombuffer(ciphertext, dtype=np.uint8)
+        del buf
+
+        jobs = [(shm.name, len(plain), len(ciphertext), bytes(key), list(sbox), mode, iv, chunk) for chunk in chunks]
+        try:
+            return list(_get_process_pool().map(_sweep_chunk, jobs))
+        except BrokenProcessPool:
+            _reset_process_pool()
+            raise
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _sweep_cbc_lockstep(cipher, iv, plain, orig, limit, flips):
+    """
+    CBC suffixes for many flips, stepped together: at block b every chain that
+    started at or before b is encrypted in one batch. Stops at the last visible block.
+    """
+    order = np.argsort(flips[:, 0], kind='stable')
+    index, mask = flips[order, 0], flips[order, 1]
+    first_block = index // 16
+
+    orig = orig.reshape(-1, 16)
+    last_block = min(len(orig), -(-limit // 16))
+
+    counts = np.zeros(len(flips))
+    sums = np.zeros(len(flips))
+    state = np.empty((len(flips), 16), dtype=np.uint8)
+    active = 0
+    for b in range(int(first_block[0]) if len(flips) else last_block, last_block):
+        # Chains starting here chain from the original previous ciphertext block
+        started = int(np.searchsorted(first_block, b, side='right'))
+        if started > active:
+            state[active:started] = np.frombuffer(bytes(iv), dtype=np.uint8) if b == 0 else orig[b - 1]
+        x = state[:started] ^ _padded_plain(plain, 16 * b + np.arange(16))
+        x[np.arange(active, started), index[active:started] % 16] ^= mask[active:started].astype(np.uint8)
+        active = started
+
+        state[:active] = cipher.encrypt_blocks(x)
+        n = min(16, limit - 16 * b)
+        diff = np.abs(state[:active, :n].astype(np.int16) - orig[b, :n])
+        counts[:active] += np.count_nonzero(diff, axis=1)
+        sums[:active] += diff.sum(axis=1)
+
+    out_counts, out_sums = np.empty_like(counts), np.empty_like(sums)
+    out_counts[order], out_sums[order] = counts, sums
+    return out_counts, out_sums
+
+def summarize_distribution(values):
+    """Mean, std, min, max and a 95% confidence interval of the mean (normal approximation)."""
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(values.mean())
+    std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+    half_width = 1.96 * std / np.sqrt(len(values))
+    return {
+        'mean': mean,
+        'std': std,
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'ci95': [mean - half_width, mean + half_width]
+    }
+
+def analyze_key_sensitivity(key, sbox, data, bits=None):
+    """
+    Key sensitivity: encrypts `data` (ECB, PKCS7) under the key and under every
+    key with one bit flipped, all keys in one batch (MultiKeyCipher).
+    Bit i is bit (7 - i % 8) of key byte i // 8, i.e. MSB first (as in /avalanche_check).
+    Returns per-bit ciphertext Hamming distances plus summary statistics.
+    """
+    from aes_cipher import MultiKeyCipher # Local import to avoid circular dependency
+
+    key = bytes(key)
+    if bits is None:
+        bits = range(8 * len(key))
+    bits = np.asarray(bits, dtype=np.int64)
+    if bits.size == 0 or bits.min() < 0 or bits.max() >= 8 * len(key):
+        raise ValueError(f'Key bit indices must be in 0..{8 * len(key) - 1}.')
+
+    # Row 0 is the original key, row j + 1 has bit bits[j] flipped
+    keys = np.tile(np.frombuffer(key, dtype=np.uint8), (len(bits) + 1, 1))
+    keys[np.arange(1, len(bits) + 1), bits // 8] ^= (1 << (7 - bits % 8)).astype(np.uint8)
+
+    ciphertexts = MultiKeyCipher(keys, sbox).encrypt_data(data)
+    distances = _POPCOUNT[ciphertexts[1:] ^ ciphertexts[0]].sum(axis=1)
+    total_bits = 8 * ciphertexts.shape[1]
+    percents = distances / total_bits * 100
+
+    return {
+        'ciphertext_hex': ciphertexts[0].tobytes().hex().upper(),
+        'total_bits': total_bits,
+        'results': [
+            {'bit': int(bit), 'hamming_distance': int(dist), 'percent': float(pct)}
+            for bit, dist, pct in zip(bits, distances, percents)
+        ],
+        'mean_distance': float(distances.mean()),
+        'min_distance': int(distances.min()),
+        'max_distance': int(distances.max()),
+        'mean_percent': float(percents.mean()),
+        'std_percent': float(percents.std())
+    }
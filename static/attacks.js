@@ -6,38 +6,12 @@ let attackSBox = null;
 
 // Helper to fetch S-Box from backend
 async function fetchPresetSBox(name) {
-    if (typeof AFFINE_MATRICES === 'undefined') return null;
-
     // Map 'aes' to 'K72' (Standard AES Matrix)
     const lookupName = name === 'aes' ? 'K72' : name;
-    const matrixDef = AFFINE_MATRICES.find(m => m.name === lookupName);
-
-    if (!matrixDef) return null;
-
-    // Determine constant: AES/K72 uses null (default), others 0
-    const isAES = name === 'aes' || name === 'K72';
-    const constant = isAES ? null : Array(8).fill(0);
-
-    try {
-        const response = await fetch('/construct', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                affine_matrix: matrixDef.matrix,
-                c_constant: constant,
-                polynomial: '0x11B'
-            })
-        });
 
-        if (response.ok) {
-            const data = await response.json();
-            // Prefer raw values
-            return data.sbox_values || data.sbox.map(h => parseInt(h, 16));
-        }
-    } catch (e) {
-        console.error("Error fetching S-Box:", e);
-    }
-    return null;
+    // Shared preset cache from comparison.js (one /construct_batch round trip)
+    const presetSBoxes = await fetchPresetSBoxes();
+    return (presetSBoxes && presetSBoxes[lookupName]) || null;
 }
 
 function popcount(n) {
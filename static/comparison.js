@@ -142,6 +142,40 @@ function updateSlotStatus(id, type, msg) {
     else indicator.style.background = '#666'; // Gray
 }
 
+// All preset S-Boxes, built by one /construct_batch call on first use
+let presetSBoxesPromise = null;
+
+function fetchPresetSBoxes() {
+    if (typeof AFFINE_MATRICES === 'undefined') return Promise.resolve(null);
+
+    if (!presetSBoxesPromise) {
+        // AES/K72 uses null (backend default C_AES), others assume 0 (Linear)
+        const constants = AFFINE_MATRICES.map(m => m.name === 'K72' ? null : Array(8).fill(0));
+
+        presetSBoxesPromise = fetch('/construct_batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                affine_matrices: AFFINE_MATRICES.map(m => m.matrix),
+                c_constants: constants,
+                polynomial: '0x11B' // Default for standard presets
+            })
+        })
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(data => {
+                const byName = {};
+                AFFINE_MATRICES.forEach((m, i) => { byName[m.name] = data.results[i].sbox_values; });
+                return byName;
+            })
+            .catch(e => {
+                console.error("Error fetching preset S-Boxes:", e);
+                presetSBoxesPromise = null; // Retry on next request
+                return null;
+            });
+    }
+    return presetSBoxesPromise;
+}
+
 async function fetchPresetMetrics(id, presetName) {
     const config = comparisonSBoxes.find(c => c.id === id);
     if (!config) return;
@@ -149,39 +183,11 @@ async function fetchPresetMetrics(id, presetName) {
     try {
         let sboxToAnalyze = null;
 
-        if (typeof AFFINE_MATRICES !== 'undefined') {
-            // Map 'aes' to 'K72' (Standard AES Matrix)
-            const lookupName = presetName === 'aes' ? 'K72' : presetName;
-
-            // Find matrix definition
-            const matrixDef = AFFINE_MATRICES.find(m => m.name === lookupName);
-
-            if (matrixDef) {
-                // Determine constant: AES uses 0x63 (Backend default), others assume 0 (Linear)
-                const isAES = presetName === 'aes' || presetName === 'K72'; // K72 is standard AES
-                const constant = isAES ? null : Array(8).fill(0); // null triggers default C_AES in backend
-
-                // Log payload for debugging
-                console.log(`[COMPARISON] sending matrix for ${presetName} (using ${lookupName}):`, matrixDef.matrix);
-                console.log(`[COMPARISON] sending constant:`, constant);
-
-                // Call /construct endpoint to get S-Box
-                const response = await fetch('/construct', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        affine_matrix: matrixDef.matrix, // Fix: Backend expects 'affine_matrix'
-                        c_constant: constant,
-                        polynomial: '0x11B' // Default for standard presets
-                    })
-                });
-
-                if (response.ok) {
-                    const data = await response.json();
-                    // Prefer raw values to avoid parsing ambiguity
-                    sboxToAnalyze = data.sbox_values || data.sbox;
-                }
-            }
+        // Map 'aes' to 'K72' (Standard AES Matrix)
+        const lookupName = presetName === 'aes' ? 'K72' : presetName;
+        const presetSBoxes = await fetchPresetSBoxes();
+        if (presetSBoxes && presetSBoxes[lookupName]) {
+            sboxToAnalyze = presetSBoxes[lookupName];
         }
 
         if (sboxToAnalyze) {
@@ -2119,6 +2119,9 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append('key', key);
             formData.append('encryption_mode', mode);
 
+            const fullResInput = document.getElementById('image-full-resolution');
+            formData.append('full_resolution', fullResInput && fullResInput.checked ? 'true' : 'false');
+
             try {
                 const originalText = encryptImageBtn.innerHTML;
                 encryptImageBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Encrypting...';
@@ -2216,6 +2219,9 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append('key', key);
             formData.append('encryption_mode', mode);
 
+            const fullResInput = document.getElementById('image-full-resolution');
+            formData.append('full_resolution', fullResInput && fullResInput.checked ? 'true' : 'false');
+
             try {
                 deepAnalysisBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Analyzing...';
                 deepAnalysisBtn.disabled = true;
@@ -2236,6 +2242,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 document.getElementById('img-npcr-value').textContent = data.npcr.toFixed(4) + '%';
                 document.getElementById('img-uaci-value').textContent = data.uaci.toFixed(4) + '%';
 
+                if (data.correlation) renderCorrelation(data.correlation);
+
             } catch (error) {
                 console.error(error);
                 alert('Analysis Error: ' + error.message);
@@ -2309,6 +2317,61 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    let corrChartOrig = null;
+    let corrChartEnc = null;
+
+    function renderCorrelation(correlation) {
+        const directions = ['horizontal', 'vertical', 'diagonal'];
+        const format = (coeffs, dir) => ['r', 'g', 'b']
+            .map(ch => coeffs[ch] ? coeffs[ch][dir].toFixed(4) : '-')
+            .join(' / ');
+
+        document.getElementById('img-correlation-body').innerHTML = directions.map(dir => `
+            <tr>
+                <td style="text-transform: capitalize;">${dir}</td>
+                <td>${format(correlation.original.coefficients, dir)}</td>
+                <td>${format(correlation.encrypted.coefficients, dir)}</td>
+            </tr>`).join('');
+        document.getElementById('img-correlation-section').classList.remove('hidden');
+
+        if (corrChartOrig) corrChartOrig.destroy();
+        if (corrChartEnc) corrChartEnc.destroy();
+        corrChartOrig = renderCorrelationScatter('corr-scatter-orig', correlation.original.scatter, 'Original (Red, Horizontal)');
+        corrChartEnc = renderCorrelationScatter('corr-scatter-enc', correlation.encrypted.scatter, 'Encrypted (Red, Horizontal)');
+    }
+
+    function renderCorrelationScatter(canvasId, scatter, label) {
+        const pairs = scatter.r ? scatter.r.horizontal : { x: [], y: [] };
+        const points = pairs.x.map((x, i) => ({ x: x, y: pairs.y[i] }));
+        const axis = {
+            min: 0,
+            max: 255,
+            grid: { color: 'rgba(255,255,255,0.05)' },
+            ticks: { color: '#6b7280' }
+        };
+
+        return new Chart(document.getElementById(canvasId).getContext('2d'), {
+            type: 'scatter',
+            data: {
+                datasets: [{
+                    data: points,
+                    pointRadius: 1,
+                    backgroundColor: 'rgba(239, 68, 68, 0.6)'
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                animation: false,
+                plugins: {
+                    legend: { display: false },
+                    title: { display: true, text: label, color: '#9ca3af' }
+                },
+                scales: { x: axis, y: axis }
+            }
+        });
+    }
+
     function renderHistogram(canvasId, histData, label) {
         const ctx = document.getElementById(canvasId).getContext('2d');
         const labels = Array.from({ length: 256 }, (_, i) => i);
@@ -0,0 +1,28 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from sbox_analyzer import AES_SBOX, ImagePipeline
+
+
+def _png(width, height):
+    rng = np.random.default_rng(width * 31 + height)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+# Images of 5 pixels or fewer hold less than the 16-byte IV (CBC/CTR)
+@pytest.mark.parametrize('mode', ['ecb', 'cbc', 'ctr', 'substitution'])
+@pytest.mark.parametrize('width, height', [(1, 1), (2, 2), (1, 5), (3, 2), (7, 3)])
+def test_sensitivity_sweep_matches_single_flips(mode, width, height):
+    pipeline = ImagePipeline(_png(width, height), AES_SBOX, 'sweep key', mode, max_pixels=None)
+    positions = [(y, x, c, bit) for y in range(height) for x in range(width) for c in range(3) for bit in (0, 7)]
+
+    npcr, uaci = pipeline.sensitivity_sweep(positions)
+    expected = np.array([pipeline.sensitivity(*p) for p in positions])
+
+    np.testing.assert_allclose(npcr, expected[:, 0])
+    np.testing.assert_allclose(uaci, expected[:, 1])